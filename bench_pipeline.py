@@ -0,0 +1,305 @@
+"""
+Benchmark of the ingest, load, and stats steps of the analysis pipeline on
+synthetic data at multiples of the size of the original data.
+
+Synthetic historian files are written with the same two header rows, columns,
+and timestamp formats as each file in `original-hydro`. The timestamps and the
+rows with baseline subtracted values are kept from the original file and the
+sensor values are random walks, so the item windows select the same number of
+rows. Days without an original h00 file get one with ~5 Hz timestamps over
+their item windows. Larger scales add copies of every day file under new day names along
+with the items for each copy in a synthetic `experiments.csv`. Copies are hard
+links of the 1x files when the file system allows it.
+
+Each step runs in a fresh process in the synthetic directory so its peak
+resident memory is measured on its own.
+
+Steps
+-----
+ingest      process all the day files with `process_hydro.py`
+load        load the PDIT700 column of 12 items with `utils.load_items`
+stats       stats for all sensors and items with `stats_hydro.py`
+
+Results are printed as JSON with the wall time, peak RSS of the main process
+and its worker processes, rows, and rows per second for each scale and step.
+
+Examples
+--------
+
+Default scales are 1x and 10x of the ~16 MB original data. The 100x scale
+writes ~1 GB of processed files.
+
+>>> python bench_pipeline.py
+>>> python bench_pipeline.py --scales 1 10 100 --out bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from schema import historians, raw_columns
+
+repo = os.path.dirname(os.path.abspath(__file__))
+steps = ('ingest', 'load', 'stats')
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def layout(src):
+    """
+    Header rows and the cells of an original historian file as strings.
+    """
+    with open(src, encoding='utf-8-sig') as f:
+        header = [f.readline(), f.readline()]
+    df = pd.read_csv(src, header=None, skiprows=2, dtype=str, keep_default_na=False)
+    return header, df
+
+
+def h00_layout(template, day, windows):
+    """
+    Header rows and cells for an h00 file of a day without an original file.
+    Timestamps are written every 0.2 s over the item windows in the three
+    formats of the h00 files and the value cells are not empty.
+
+    Parameters
+    ----------
+    template : str
+        Path to an original h00 file for the header rows.
+    day : str
+        Day of the file such as 2018-12-11.
+    windows : list
+        Tuples of (start, stop) times of the items such as ('16:38', '16:54').
+    """
+    with open(template, encoding='utf-8-sig') as f:
+        header = [f.readline(), f.readline()]
+    ncols = len(header[1].split(','))
+    t = pd.DatetimeIndex(np.concatenate([
+        pd.date_range(f'{day} {start}', f'{day} {stop}', freq='200ms').to_numpy() for start, stop in windows
+    ]))
+
+    df = pd.DataFrame('0', index=range(len(t)), columns=range(ncols))
+    cs = (t.microsecond // 10000).map('{:02d}'.format)
+    df[0] = t.strftime('%m/%d/%Y ') + t.hour.astype(str) + t.strftime(':%M:%S.') + cs
+    df[1] = t.strftime('%m/%d/%y')
+    df[2] = t.strftime('%H:%M:%S:') + cs
+    return header, df
+
+
+def synthesize(header, df, hist, dst, rng):
+    """
+    Write a synthetic historian file with the layout of an original file.
+
+    Parameters
+    ----------
+    header : list
+        First two rows of the original file.
+    df : dataframe
+        Cells of the original file as strings. Timestamp columns are kept and
+        value cells that are not empty are replaced with random walks.
+    hist : str
+        Historian of the file such as h0m.
+    dst : str
+        Path to the synthetic file.
+    rng : generator
+        Random number generator for the sensor values.
+
+    Returns
+    -------
+    nrows : int
+        Number of rows with a timestamp.
+    """
+    out = df.iloc[:, :3].copy()
+    n = len(df)
+
+    def walk(ncols, start, step):
+        return start + np.cumsum(rng.normal(0, step, (n, ncols)), axis=0)
+
+    if hist in raw_columns:
+        raw = raw_columns[hist]
+        subtracted = historians[hist][0][1:]
+        fields = header[0].rstrip('\r\n').split(',')
+        base = np.array([float(fields[c]) if fields[c] else 0.0 for c in raw])
+        values = walk(len(raw), base, 1e-3)
+        for j, (r, s) in enumerate(zip(raw, subtracted)):
+            out[r] = np.where(df[r] != '', values[:, j], np.nan)
+            out[s] = np.where(df[s] != '', values[:, j] - base[j], np.nan)
+    else:
+        cols = historians[hist][0][1:]
+        values = walk(len(cols), 500.0, 0.1)
+        for j, c in enumerate(cols):
+            out[c] = np.where(df[c] != '', values[:, j], np.nan)
+
+    out = out.reindex(columns=range(df.shape[1]))
+    with open(dst, 'w', encoding='utf-8-sig', newline='') as f:
+        f.writelines(header)
+        out.to_csv(f, header=False, index=False, float_format='%.6f', na_rep='')
+
+    return int((df[0] != '').sum())
+
+
+def build(root, scale, seed=42):
+    """
+    Write the synthetic original files and experiment registry for a scale.
+    Days of the registry without an original h00 file get an h00 file over
+    their item windows.
+
+    Returns
+    -------
+    nrows : int
+        Number of rows with a timestamp in all the synthetic files.
+    """
+    rng = np.random.default_rng(seed)
+    src = os.path.join(repo, 'original-hydro')
+    dst = os.path.join(root, 'original-hydro')
+    for d in ('original-hydro', 'processed-hydro', 'results-hydro'):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+
+    exps = pd.read_csv(os.path.join(repo, 'experiments.csv'), dtype=str, keep_default_na=False)
+    files = sorted(f for f in os.listdir(src) if f.startswith('rd'))
+    template = os.path.join(src, next(f for f in files if f.endswith('h00.csv')))
+    layouts = {f: layout(os.path.join(src, f)) for f in files}
+    for (day, date), e in exps.groupby(['file', 'date']):
+        if f'{day}_h00.csv' not in layouts:
+            layouts[f'{day}_h00.csv'] = h00_layout(template, date, list(zip(e['start'], e['stop'])))
+
+    nrows = 0
+    for f, (header, df) in sorted(layouts.items()):
+        day, hist = f[:-4].split('_')
+        nrows += synthesize(header, df, hist, os.path.join(dst, f), rng) * scale
+        for k in range(1, scale):
+            copy = os.path.join(dst, f'{day}x{k:03d}_{hist}.csv')
+            try:
+                os.link(os.path.join(dst, f), copy)
+            except OSError:
+                shutil.copyfile(os.path.join(dst, f), copy)
+
+    frames = [exps]
+    for k in range(1, scale):
+        e = exps.copy()
+        e['item'] = [f'{int(i) + 1000 * k:03d}' for i in e['item']]
+        e['file'] = [f'{day}x{k:03d}' for day in e['file']]
+        frames.append(e)
+    pd.concat(frames).to_csv(os.path.join(root, 'experiments.csv'), index=False)
+
+    return nrows
+
+
+def run_step(step, jobs):
+    """
+    Run a step of the pipeline in the current directory.
+
+    Returns
+    -------
+    nrows : int
+        Number of rows processed by the step.
+    """
+    if step == 'ingest':
+        import process_hydro
+        from riser import parser
+        options = ['--jobs', str(jobs)] if jobs else []
+        process_hydro.run(parser().parse_args(['ingest', '--force', *options]))
+        return None
+
+    if step == 'load':
+        from utils import load_items
+        items = list(pd.read_csv('experiments.csv', dtype=str)['item'][:12])
+        return len(load_items('PDIT700', items))
+
+    if step == 'stats':
+        from stats_hydro import batch_stats, experiments, load_long
+        df_exp = experiments()
+        df_long = load_long(df_exp['item'])
+        batch_stats(df_long, df_exp).to_csv('results-hydro/stats_all.csv', index=False)
+        return len(df_long)
+
+
+def peak_rss():
+    """
+    Peak resident memory of this process in MB. VmHWM is reset when the
+    process starts so it does not include the memory of the parent at fork
+    time like ru_maxrss does, which is in kilobytes on Linux.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(step, root, jobs):
+    """
+    Run one step in the synthetic directory and print its measurements as
+    JSON. Output of the pipeline is discarded.
+    """
+    os.chdir(root)
+    sys.path.insert(0, repo)
+    tic = time.perf_counter()
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+        nrows = run_step(step, jobs)
+    wall = time.perf_counter() - tic
+
+    rss = peak_rss()
+    rss_workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(json.dumps({'wall_s': wall, 'peak_rss_mb': rss, 'peak_rss_workers_mb': rss_workers, 'rows': nrows}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', nargs='+', type=int, default=[1, 10], help='multiples of the original data size')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes for ingest')
+    parser.add_argument('--root', default=None, help='directory for the synthetic data, default is a temporary directory')
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic data')
+    parser.add_argument('--out', default=None, help='JSON file for the results')
+    parser.add_argument('--step', choices=steps, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.step:
+        child(args.step, args.root, args.jobs)
+        return
+
+    results = []
+    for scale in args.scales:
+        root = os.path.join(args.root, f'scale-{scale}') if args.root else tempfile.mkdtemp(prefix=f'bench-hydro-{scale}x-')
+        print(f'Build {scale}x synthetic data in {root} ... ', end='', flush=True)
+        nrows = build(root, scale)
+        size = sum(e.stat().st_size for e in os.scandir(os.path.join(root, 'original-hydro')))
+        print('Complete.')
+
+        for step in steps:
+            cmd = [sys.executable, os.path.abspath(__file__), '--step', step, '--root', root]
+            if args.jobs:
+                cmd += ['--jobs', str(args.jobs)]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode:
+                sys.exit(f'{step} failed at {scale}x\n{proc.stderr}')
+            out = proc.stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            rows = nrows if r['rows'] is None else r['rows']
+            r.update(scale=scale, step=step, input_mb=size / 1e6, rows=rows, rows_per_s=rows / r['wall_s'])
+            results.append(r)
+            print(f"{scale:>4}x {step:7} {r['wall_s']:8.2f} s {r['peak_rss_mb']:8.0f} MB {r['rows_per_s']:>14,.0f} rows/s")
+
+        if not args.keep:
+            shutil.rmtree(root)
+
+    report = json.dumps(results, indent=1)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the timestamp parser in `timestamps.py` against the
+`pd.to_datetime` calls previously used in `process_hydro.py`. The DateTime
+column of an original h00, h0m, and h19 file and a processed file are repeated
+to give a larger number of rows. Throughput is reported in rows per second.
+
+Example
+-------
+>>> python bench_timestamps.py
+>>> python bench_timestamps.py --repeat 50
+"""
+
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+from timestamps import parse_timestamps
+
+# Files and the format given to `pd.to_datetime` in the original processing
+cases = (
+    ('h00', 'original-hydro/rd181217_h00.csv', 2, '%m/%d/%Y %H:%M:%S.%f'),
+    ('h0m', 'original-hydro/rd181217_h0m.csv', 2, '%m/%d/%Y %H:%M:%S'),
+    ('h19', 'original-hydro/rd181217_h19.csv', 2, None),
+    ('processed', 'processed-hydro/017_rd181217_h00.csv', 1, None),
+)
+
+
+def timeit(func, n=3):
+    """
+    Best elapsed time in seconds and the result of calling `func` n times.
+    """
+    best = float('inf')
+    for _ in range(n):
+        tic = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - tic)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10, help='times to repeat the DateTime column of each file')
+    args = parser.parse_args()
+
+    print(f"\n{'File':10} {'Rows':>10} {'to_datetime [rows/s]':>21} {'parse_timestamps [rows/s]':>26} {'Speedup':>8}")
+
+    for name, path, skip, fmt in cases:
+        col = pd.read_csv(path, skiprows=skip, header=None, usecols=[0])[0].dropna()
+        values = np.tile(col.to_numpy(), args.repeat)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            t_pd, expected = timeit(lambda: pd.to_datetime(values, format=fmt).as_unit('ns').asi8)
+        t_np, ns = timeit(lambda: parse_timestamps(values))
+
+        if not np.array_equal(ns, expected):
+            raise ValueError(f'Parsed timestamps for {name} do not match pandas.')
+
+        n = len(values)
+        print(f'{name:10} {n:>10} {n / t_pd:>21,.0f} {n / t_np:>26,.0f} {t_pd / t_np:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,56 +1,77 @@
 """
-Compare PDIT700 differential pressure in R-cubed riser for different process gas
-conditions. Requires the results files generated from `dp_cat.py` to be in the
-`results-hydro` folder.
+Compare differential pressure in R-cubed riser for different process gas
+conditions. The mean of each item is from the stats of `stats_hydro.py`, which
+are computed first if `results-hydro/stats_all.csv` does not exist. Lines of
+each replicate are drawn across the low, mid, and high gas flows for each
+catalyst group along with the surface from `fit_hydro.py` at the mean catalyst
+flow of the group.
+
+Examples
+--------
+
+Optional argument for any sensor such as pdit700, pdit704, or te709c. Default
+is PDIT700. Use the degree option for the total degree of the fitted surface.
+
+>>> python dp_gas.py
+>>> python dp_gas.py pdit704 --degree 1
 """
 
+import argparse
+from riser import any_sensor
+
+# Command line argument
+# ----------------------------------------------------------------------------
+
+parser = argparse.ArgumentParser()
+parser.add_argument('col', nargs='?', type=any_sensor, default='PDIT700', help='sensor name as PDIT700, TE709C etc.')
+parser.add_argument('--degree', type=int, default=2, choices=[1, 2, 3], help='total degree of the fitted surface')
+args = parser.parse_args()
+col = args.col
+
+# heavy imports after the arguments are checked so errors return quickly
 import matplotlib.pyplot as plt
-import pandas as pd
+import numpy as np
+from fit_hydro import design, fit_surfaces, load_stats
 from utils import config
 
-# Plot
+# Mean of each item and fitted surface
 # ----------------------------------------------------------------------------
 
-gasflow = [320, 400, 480]
-
-df_low = pd.read_csv('results-hydro/pdit700_low.csv', index_col=0)
-df_mid = pd.read_csv('results-hydro/pdit700_mid.csv', index_col=0)
-df_high = pd.read_csv('results-hydro/pdit700_high.csv', index_col=0)
-
-df_comp = pd.DataFrame(columns=['catflow', 'gas_low', 'gas_mid', 'gas_high'])
-for i in range(len(df_low)):
-    if i < 3:
-        catflow = 'none'
-    if 3 <= i < 6:
-        catflow = 'low'
-    if 6 <= i < 9:
-        catflow = 'mid'
-    if 9 <= i:
-        catflow = 'high'
-    gaslow = df_low.iloc[i]['mean']
-    gasmid = df_mid.iloc[i]['mean']
-    gashigh = df_high.iloc[i]['mean']
-    df_comp.loc[i] = [catflow, gaslow, gasmid, gashigh]
+df_stats = load_stats()
+df_stats = df_stats[df_stats['sensor'] == col]
+df_coefs, _, fit = fit_surfaces(df_stats, args.degree)
+
+# replicates of each catalyst group as rows and process gas flow [SLM] as
+# columns, max catalyst items are only at low gas flow so they are not drawn
+cats = ('none', 'low', 'mid', 'high')
+df = df_stats[df_stats['cat'].astype(str).isin(cats)]
+df_comp = df.pivot_table(index=['cat', 'replicate'], columns='gasflow', values='mean', observed=True)
+catflow = df.groupby(df['cat'].astype(str))['catflow'].mean()
+
+gasflow = np.linspace(df_comp.columns.min(), df_comp.columns.max(), 50)
 
 # Plot
 # ----------------------------------------------------------------------------
 
+if col.startswith('TE'):
+    ylabel = f'Temperature, {col} [K]'
+elif col.startswith('PDIT'):
+    ylabel = f'Differential pressure, {col} [kPa]'
+else:
+    ylabel = col
+
 plt.close()
 
 fig, ax = plt.subplots()
-ax.plot(gasflow, df_comp.iloc[0][1:], 'C0', marker='.', label='none')
-ax.plot(gasflow, df_comp.iloc[1][1:], 'C0', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[2][1:], 'C0', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[3][1:], 'C1', marker='.', label='low')
-ax.plot(gasflow, df_comp.iloc[4][1:], 'C1', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[5][1:], 'C1', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[6][1:], 'C2', marker='.', label='mid')
-ax.plot(gasflow, df_comp.iloc[7][1:], 'C2', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[8][1:], 'C2', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[9][1:], 'C3', marker='.', label='high')
-ax.plot(gasflow, df_comp.iloc[10][1:], 'C3', marker='.', label='_nolegend_')
-ax.plot(gasflow, df_comp.iloc[11][1:], 'C3', marker='.', label='_nolegend_')
-config(ax, 'Gas flow [SLM]', 'Differential pressure [kPa]')
+for k, cat in enumerate(cats):
+    rows = df_comp.loc[cat]
+    for j, (_, y) in enumerate(rows.iterrows()):
+        ax.plot(y.index, y.to_numpy(), f'C{k}', marker='.', label=cat if j == 0 else '_nolegend_')
+    X, _ = design(gasflow, np.full_like(gasflow, catflow[cat]), args.degree)
+    ax.plot(gasflow, X @ fit['beta'][:, 0], f'C{k}', linestyle='--', label='_nolegend_')
+config(ax, 'Gas flow [SLM]', ylabel)
 ax.legend(loc='lower left', bbox_to_anchor=(0.0, 1.01), ncol=4, frameon=False)
 
+print(df_coefs.T.to_string(header=False))
+
 plt.show()
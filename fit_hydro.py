@@ -0,0 +1,280 @@
+"""
+Fit the stats of every sensor as a polynomial surface in process gas flow and
+catalyst flow. The per-item stats from `stats_hydro.py` are arranged as one
+matrix with a row for each item and a column for each sensor, and the
+surfaces for all the sensors are fit together with batched least squares.
+Sensors with the same missing items share one `lstsq` call with a column of
+the right-hand side for each sensor. The max catalyst flow items from
+`dp_cat_max.py` are part of the fits.
+
+Confidence intervals of the coefficients are from the residuals of each fit.
+The replicates of each gas and catalyst group give the pure error interval of
+the group mean, which is compared with the interval of the fitted surface at
+the mean catalyst flow of the group.
+
+Results are written to `results-hydro/fit_coefs.csv` for the coefficients of
+each sensor and `results-hydro/fit_groups.csv` for each sensor and group.
+
+Examples
+--------
+
+The stats are read from `results-hydro/stats_all.csv` and are computed first
+if the file does not exist or the recompute option is given. Use the degree
+option for the total degree of the surface and the metric option to fit the
+std, max, or min of each item instead of the mean.
+
+>>> python fit_hydro.py
+>>> python fit_hydro.py --degree 1 --sensors pdit700 pdit704 te709c
+>>> python fit_hydro.py --metric std --level 0.9 --recompute
+"""
+
+import math
+import os
+import sys
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def t_interval(level, dof):
+    """
+    Quantile of Student's t distribution for a two-sided interval such as 0.95
+    with an integer number of degrees of freedom. The probability that |T| < t
+    is the finite series of Abramowitz and Stegun 26.7.3 and 26.7.4 in
+    theta = atan(t / sqrt(dof)), which is solved for theta by bisection.
+    """
+    if dof < 1:
+        return math.nan
+
+    def prob(theta):
+        c2 = math.cos(theta) ** 2
+        if dof % 2:
+            term = total = math.cos(theta) if dof > 1 else 0.0
+            for k in range(1, dof - 2, 2):
+                term *= c2 * (k + 1) / (k + 2)
+                total += term
+            return 2 / math.pi * (theta + math.sin(theta) * total)
+        term = total = 1.0
+        for k in range(0, dof - 2, 2):
+            term *= c2 * (k + 1) / (k + 2)
+            total += term
+        return math.sin(theta) * total
+
+    lo, hi = 0.0, math.pi / 2
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        if prob(mid) < level:
+            lo = mid
+        else:
+            hi = mid
+    return math.sqrt(dof) * math.tan((lo + hi) / 2)
+
+
+def design(gasflow, catflow, degree=2):
+    """
+    Columns of a polynomial surface in gas flow g and catalyst flow c up to a
+    total degree, ordered as 1, g, c, g^2, g*c, c^2 and so on.
+
+    Returns
+    -------
+    X : array
+        Design matrix with a row for each item.
+    terms : list
+        Name of each column.
+    """
+    import numpy as np
+
+    g = np.asarray(gasflow, dtype=float)
+    c = np.asarray(catflow, dtype=float)
+    cols = []
+    terms = []
+    for d in range(degree + 1):
+        for j in range(d + 1):
+            i = d - j
+            cols.append(g ** i * c ** j)
+            names = [f'{v}^{e}' if e > 1 else v for v, e in (('g', i), ('c', j)) if e]
+            terms.append('*'.join(names) or '1')
+    return np.column_stack(cols), terms
+
+
+def fit_batch(X, Y, level=0.95):
+    """
+    Least squares fits of each column of Y on the columns of X. Rows where a
+    column of Y is NaN are left out of its fit. Columns with the same missing
+    rows are solved together with one `lstsq` call.
+
+    Parameters
+    ----------
+    X : array
+        Design matrix of shape (n, p).
+    Y : array
+        Values of shape (n, m) such as the mean of each sensor for each item.
+    level : float
+        Confidence level of the intervals.
+
+    Returns
+    -------
+    fit : dict
+        Coefficients `beta` and interval half-widths `ci` of shape (p, m),
+        coefficient covariances `cov` of shape (m, p, p), and the number of
+        rows `n`, degrees of freedom `dof`, rank, rmse, and r2 of shape (m,).
+    """
+    import numpy as np
+
+    n, p = X.shape
+    m = Y.shape[1]
+    fit = {
+        'beta': np.full((p, m), np.nan), 'ci': np.full((p, m), np.nan), 'cov': np.full((m, p, p), np.nan),
+        'n': np.zeros(m, int), 'dof': np.zeros(m, int), 'rank': np.zeros(m, int),
+        'rmse': np.full(m, np.nan), 'r2': np.full(m, np.nan)
+    }
+
+    ok = ~np.isnan(Y)
+    patterns, inverse = np.unique(ok.T, axis=0, return_inverse=True)
+    for k, rows in enumerate(patterns):
+        cols = np.flatnonzero(inverse.ravel() == k)
+        if not rows.any():
+            continue
+        Xk = X[rows]
+        Yk = Y[np.ix_(rows, cols)]
+        beta, _, rank, _ = np.linalg.lstsq(Xk, Yk, rcond=None)
+        resid = Yk - Xk @ beta
+        dof = rows.sum() - rank
+        rss = (resid ** 2).sum(axis=0)
+        tss = ((Yk - Yk.mean(axis=0)) ** 2).sum(axis=0)
+
+        # covariance from the pseudo-inverse of X so the normal equations
+        # are not formed
+        pinv = np.linalg.pinv(Xk)
+        s2 = rss / dof if dof > 0 else np.full(len(cols), np.nan)
+        cov = s2[:, None, None] * (pinv @ pinv.T)
+
+        fit['beta'][:, cols] = beta
+        fit['cov'][cols] = cov
+        fit['ci'][:, cols] = t_interval(level, dof) * np.sqrt(np.diagonal(cov, axis1=1, axis2=2)).T
+        fit['n'][cols] = rows.sum()
+        fit['dof'][cols] = dof
+        fit['rank'][cols] = rank
+        fit['rmse'][cols] = np.sqrt(rss / rows.sum())
+        fit['r2'][cols] = 1 - np.divide(rss, tss, out=np.full(len(cols), np.nan), where=tss > 0)
+
+    return fit
+
+
+def load_stats(path='results-hydro/stats_all.csv', recompute=False):
+    """
+    Per-item stats for every sensor along with the gas flow of each item from
+    the registry. The stats are computed with `stats_hydro.py` and written to
+    the file if it does not exist or `recompute` is True.
+    """
+    import pandas as pd
+    from registry import load_experiments
+
+    if recompute or not os.path.exists(path):
+        from stats_hydro import batch_stats, experiments, load_long
+        df_exp = experiments()
+        df = batch_stats(load_long(df_exp['item']), df_exp)
+        df.to_csv(path, index=False)
+    else:
+        df = pd.read_csv(path, dtype={'item': str})
+
+    df['gasflow'] = df['item'].map(load_experiments()['gasflow']).astype(float)
+    return df
+
+
+def fit_surfaces(df_stats, degree=2, metric='mean', level=0.95):
+    """
+    Fit a surface in gas flow and catalyst flow to a metric of every sensor.
+
+    Parameters
+    ----------
+    df_stats : dataframe
+        Stats from `load_stats` with sensor, item, gasflow, catflow, and
+        metric columns.
+    degree : int
+        Total degree of the polynomial surface.
+    metric : str
+        Stats column to fit such as mean or std.
+    level : float
+        Confidence level of the intervals.
+
+    Returns
+    -------
+    df_coefs : dataframe
+        Coefficients and their interval half-widths for each sensor along with
+        the number of items, degrees of freedom, rank, rmse, and r2.
+    df_groups : dataframe
+        Mean, std, and pure error interval of the replicates for each sensor
+        and gas and catalyst group, and the fitted value and its interval at
+        the gas flow and mean catalyst flow of the group. Each max catalyst
+        flow item is its own group.
+    fit : dict
+        Arrays from `fit_batch` with the sensors as the columns.
+    """
+    import numpy as np
+    import pandas as pd
+
+    Y = df_stats.pivot(index='item', columns='sensor', values=metric)
+    flows = df_stats.drop_duplicates('item').set_index('item').loc[Y.index, ['gasflow', 'catflow']]
+    X, terms = design(flows['gasflow'], flows['catflow'], degree)
+    fit = fit_batch(X, Y.to_numpy(dtype=float), level)
+    sensors = list(Y.columns)
+
+    df_coefs = pd.DataFrame({'sensor': sensors, 'metric': metric, 'degree': degree})
+    for k, term in enumerate(terms):
+        df_coefs[f'b[{term}]'] = fit['beta'][k]
+        df_coefs[f'ci[{term}]'] = fit['ci'][k]
+    for key in ('n', 'dof', 'rank', 'rmse', 'r2'):
+        df_coefs[key] = fit[key]
+
+    # replicates of a gas and catalyst group, max catalyst items are single
+    df = df_stats.dropna(subset=[metric]).copy()
+    cat = df['cat'].astype(str)
+    df['group'] = np.where(cat == 'max', 'max-' + df['item'], cat)
+    grouped = df.groupby(['sensor', 'gas', 'group'], sort=False, observed=True)
+    df_groups = grouped.agg(
+        gasflow=('gasflow', 'first'), catflow=('catflow', 'mean'),
+        n=(metric, 'count'), mean=(metric, 'mean'), std=(metric, 'std')
+    ).reset_index()
+    tq = np.array([t_interval(level, k - 1) for k in df_groups['n']])
+    df_groups['ci'] = tq * df_groups['std'] / np.sqrt(df_groups['n'])
+
+    # fitted value and its interval at each group for all the groups at once
+    X0, _ = design(df_groups['gasflow'], df_groups['catflow'], degree)
+    col = Y.columns.get_indexer(df_groups['sensor'])
+    df_groups['fit'] = np.einsum('ri,ir->r', X0, fit['beta'][:, col])
+    se = np.sqrt(np.einsum('ri,rij,rj->r', X0, fit['cov'][col], X0))
+    df_groups['fit_ci'] = np.array([t_interval(level, d) for d in fit['dof'][col]]) * se
+
+    return df_coefs, df_groups, fit
+
+
+def run(args):
+    """
+    Fit the surfaces and write the coefficients and groups. The arguments are
+    the degree, metric, level, sensors, and recompute options of the fit
+    subcommand in `riser.py`.
+    """
+    import time
+
+    df_stats = load_stats(recompute=args.recompute)
+    if args.sensors:
+        df_stats = df_stats[df_stats['sensor'].isin(args.sensors)]
+
+    tic = time.perf_counter()
+    df_coefs, df_groups, _ = fit_surfaces(df_stats, args.degree, args.metric, args.level)
+    toc = time.perf_counter()
+
+    print(df_coefs)
+    print(f'Fit {len(df_coefs)} sensors and {len(df_groups)} sensor groups in {toc - tic:.3f} s.')
+    df_coefs.to_csv('results-hydro/fit_coefs.csv', index=False)
+    df_groups.to_csv('results-hydro/fit_groups.csv', index=False)
+
+
+def main():
+    import riser
+    riser.main(['fit', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
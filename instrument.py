@@ -0,0 +1,238 @@
+"""
+Lightweight instrumentation of the pipeline stages. Stages such as parsing
+the CSV files, parsing timestamps, slicing the item windows, writing files,
+joining frames, and plotting are timed with `stage`, and the bytes read, rows
+parsed, and rows kept for each file and item are added up with `count`. When
+profiling is off `stage` returns one shared null context and `count` returns
+right away, so the hooks can stay in the hot paths.
+
+Profiling is switched on with the `RISER_PROFILE=1` environment variable or
+the profile option of any `riser.py` subcommand. A summary of the time in
+each stage and the counters for each file and item is printed when the
+command is done. Stages that run in worker processes are sent back with their
+results and merged into the summary.
+
+With the profile-out option or the `RISER_PROFILE_OUT` environment variable a
+cProfile file `<prefix>.prof` is written for the main process and
+`<prefix>-<pid>.prof` for each worker, which can be viewed with snakeviz or
+converted to a flame graph with flameprof. The stage timings are also written
+to `<prefix>.trace.json` in the Chrome trace event format, which can be opened
+in Perfetto or speedscope.
+
+Examples
+--------
+>>> RISER_PROFILE=1 python process_hydro.py --force
+>>> python riser.py ingest --force --profile
+>>> python riser.py stats --profile-out stats
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+
+enabled = os.environ.get('RISER_PROFILE', '') not in ('', '0')
+out = os.environ.get('RISER_PROFILE_OUT') or None
+enabled = enabled or out is not None
+
+# calls and seconds for each stage, counters for each file or item key, and
+# trace events of the stages
+stages = {}
+counters = {}
+events = []
+
+null = contextlib.nullcontext()
+lock = threading.Lock()
+worker_profile = None
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Time the body of a with statement as one call of a stage.
+    """
+    tic = time.perf_counter()
+    try:
+        yield
+    finally:
+        toc = time.perf_counter()
+        with lock:
+            s = stages.setdefault(name, [0, 0.0])
+            s[0] += 1
+            s[1] += toc - tic
+            if out:
+                events.append({
+                    'name': name, 'ph': 'X', 'ts': tic * 1e6, 'dur': (toc - tic) * 1e6,
+                    'pid': os.getpid(), 'tid': threading.get_ident()
+                })
+
+
+def stage(name):
+    """
+    Context manager that times a stage such as read_csv or to_csv when
+    profiling is on and does nothing when it is off.
+
+    >>> with stage('read_csv'):
+    ...     df = pd.read_csv(path)
+    """
+    return timed(name) if enabled else null
+
+
+def count(key, **values):
+    """
+    Add values such as bytes_read, rows_parsed, or rows_kept to the counters
+    of a file or item key such as rd181210_h0m or 001_h0m.
+    """
+    if not enabled:
+        return
+    with lock:
+        c = counters.setdefault(key, {})
+        for k, v in values.items():
+            c[k] = c.get(k, 0) + v
+
+
+def enable(prefix=None):
+    """
+    Switch profiling on for this process and the worker processes it starts.
+    Trace and cProfile files are written with the prefix if given.
+    """
+    global enabled, out
+    enabled = True
+    os.environ['RISER_PROFILE'] = '1'
+    if prefix:
+        out = prefix
+        os.environ['RISER_PROFILE_OUT'] = prefix
+
+
+def reset():
+    """
+    Clear the stages, counters, and events of this process.
+    """
+    with lock:
+        stages.clear()
+        counters.clear()
+        events.clear()
+
+
+def snapshot():
+    """
+    Copy of the stages, counters, and events of this process.
+    """
+    with lock:
+        return {
+            'stages': {k: list(v) for k, v in stages.items()},
+            'counters': {k: dict(v) for k, v in counters.items()},
+            'events': list(events)
+        }
+
+
+def merge(snap):
+    """
+    Add a snapshot from a worker process to the stages, counters, and events
+    of this process.
+    """
+    if not snap:
+        return
+    with lock:
+        for name, (calls, seconds) in snap['stages'].items():
+            s = stages.setdefault(name, [0, 0.0])
+            s[0] += calls
+            s[1] += seconds
+        for key, values in snap['counters'].items():
+            c = counters.setdefault(key, {})
+            for k, v in values.items():
+                c[k] = c.get(k, 0) + v
+        events.extend(snap['events'])
+
+
+def call(fn, *args, **kwargs):
+    """
+    Run a function in a worker process and return its result along with a
+    snapshot of the stages it ran, which is None when profiling is off. The
+    stages inherited from the parent process are cleared first so they are
+    not counted twice.
+
+    >>> pool.submit(call, process_file, fname, hist, windows)
+    """
+    global worker_profile
+    if not enabled:
+        return fn(*args, **kwargs), None
+
+    reset()
+    if out:
+        import cProfile
+        worker_profile = worker_profile or cProfile.Profile()
+        worker_profile.enable()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        if out:
+            worker_profile.disable()
+            worker_profile.dump_stats(f'{out}-{os.getpid()}.prof')
+    return result, snapshot()
+
+
+def summary(wall):
+    """
+    Table of the calls, total and mean time, and share of the wall time for
+    each stage followed by the counters for each file and item. Stages in
+    worker processes can add up to more than the wall time.
+    """
+    lines = [f'{"Stage":<20} {"calls":>7} {"total s":>9} {"mean ms":>9} {"share":>6}']
+    for name, (calls, seconds) in sorted(stages.items(), key=lambda kv: -kv[1][1]):
+        lines.append(f'{name:<20} {calls:>7} {seconds:>9.3f} {1e3 * seconds / calls:>9.2f} {seconds / wall:>6.0%}')
+    lines.append(f'{"wall":<20} {"":>7} {wall:>9.3f}')
+
+    names = sorted({k for c in counters.values() for k in c})
+    if names:
+        lines.append('')
+        lines.append(f'{"File or item":<20} ' + ' '.join(f'{n:>12}' for n in names))
+        for key in sorted(counters):
+            values = (counters[key].get(n) for n in names)
+            lines.append(f'{key:<20} ' + ' '.join('{:>12}'.format('' if v is None else f'{v:,}') for v in values))
+    return '\n'.join(lines)
+
+
+def write_trace(path):
+    """
+    Write the stage events in the Chrome trace event format.
+    """
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+@contextlib.contextmanager
+def session(profile=False, prefix=None):
+    """
+    Profile the body of a with statement when the profile option, the prefix,
+    or the environment variables are given. The summary is printed and the
+    trace and cProfile files are written at the end.
+    """
+    if profile or prefix:
+        enable(prefix)
+    if not enabled:
+        yield
+        return
+
+    prof = None
+    if out:
+        import cProfile
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        prof = cProfile.Profile()
+        prof.enable()
+    tic = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - tic
+        if prof is not None:
+            prof.disable()
+            prof.dump_stats(f'{out}.prof')
+            write_trace(f'{out}.trace.json')
+        print(summary(wall))
+        if out:
+            print(f'Wrote {out}.prof and {out}.trace.json')
@@ -0,0 +1,205 @@
+"""
+Atmospheric pressure from the PIT000 sensor at NREL as a sorted time index.
+The sheet in `original-hydro/pit000_patm.csv` has Date, Time, and PIT000
+columns for each day side by side. The columns of each day are found from the
+header and all the days are stacked into one array of timestamps sorted in
+time and one array of pressures. The arrays are saved to `cache-hydro/patm.npz`
+and are built again only when the sheet changes.
+
+Ambient pressure is joined onto the timestamps of any item with one
+`searchsorted` into the sorted index, which takes the last PIT000 reading at
+or before each timestamp within a tolerance. The absolute pressure is the
+PIT700 or PIT780 gauge pressure plus the ambient pressure. The gauge pressures
+are the raw values with the baseline added back, see `read_processed` in
+`utils.py`.
+
+Examples
+--------
+>>> from patm import absolute
+>>> from utils import read_processed
+>>> df = absolute(read_processed('001', 'h0m', ['PIT700', 'PIT780'], raw=True))
+
+Daily stats, the ambient and absolute pressures of each item, and the plot of
+the atmospheric pressure are from `p_atm.py`.
+
+>>> python p_atm.py
+"""
+
+import os
+import numpy as np
+from timestamps import parse_timestamps
+
+sheet = os.path.join('original-hydro', 'pit000_patm.csv')
+store = os.path.join('cache-hydro', 'patm.npz')
+
+# gauge pressure sensors in the h0m historian
+gauges = ['PIT700', 'PIT780']
+
+# timestamps and pressures for each store along with the key of the sheet
+_indexes = {}
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def sheet_key(path):
+    """
+    Size and modification time of the sheet used to check the store.
+    """
+    st = os.stat(path)
+    return f'{st.st_size}-{st.st_mtime_ns}'
+
+
+def read_sheet(path=sheet):
+    """
+    Read the PIT000 sheet into sorted arrays of timestamps and pressures.
+    Rows without a date, time, or pressure are dropped and repeated
+    timestamps are kept once.
+
+    Returns
+    -------
+    ns : array
+        Timestamps as int64 nanoseconds.
+    patm : array
+        Atmospheric pressure in kPa.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    names = [c.split('.')[0] for c in df.columns]
+    starts = [k for k, c in enumerate(names) if c == 'Date']
+    stamps = []
+    values = []
+
+    for k in starts:
+        if names[k + 1:k + 3] != ['Time', 'PIT000']:
+            raise ValueError(f'Unexpected column names after column {k} in {path}.')
+        date, tod, p = (df.iloc[:, k + j] for j in range(3))
+        ok = ((date != '') & (tod != '') & (p != '')).to_numpy()
+        stamps.append((date + ' ' + tod).to_numpy(dtype=str)[ok])
+        values.append(p.to_numpy(dtype=str)[ok].astype(float))
+
+    ns = parse_timestamps(np.concatenate(stamps), '%m/%d/%y %H:%M:%S')
+    ns, first = np.unique(ns, return_index=True)
+    return ns, np.concatenate(values)[first]
+
+
+def build_index(src=sheet, dst=store):
+    """
+    Read the sheet and save the sorted arrays to the store.
+    """
+    from process_hydro import atomic
+
+    ns, patm = read_sheet(src)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with atomic(dst) as tmp, open(tmp, 'wb') as f:
+        np.savez(f, time=ns, patm=patm, key=sheet_key(src))
+    return ns, patm
+
+
+def load_index(src=sheet, dst=store):
+    """
+    Sorted timestamps and pressures of the PIT000 sensor. The arrays are
+    loaded once for each process and the store is built again if the sheet
+    has changed.
+    """
+    key = sheet_key(src)
+    cached = _indexes.get(dst)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    arrays = None
+    if os.path.exists(dst):
+        with np.load(dst) as z:
+            if str(z['key']) == key:
+                arrays = (z['time'], z['patm'])
+    if arrays is None:
+        arrays = build_index(src, dst)
+
+    _indexes[dst] = (key, arrays)
+    return arrays
+
+
+def ambient(times, tolerance=120.0):
+    """
+    Atmospheric pressure at each timestamp as the last PIT000 reading at or
+    before it. The value is NaN if there is no reading within `tolerance`
+    seconds before the timestamp.
+
+    Parameters
+    ----------
+    times : array
+        Timestamps as datetime64 values or a DatetimeIndex.
+    tolerance : float
+        Largest age of the reading in seconds, PIT000 is recorded about once
+        a minute.
+
+    Returns
+    -------
+    patm : array
+        Atmospheric pressure in kPa for each timestamp.
+    """
+    t, p = load_index()
+    ns = np.asarray(times).astype('datetime64[ns]').view(np.int64)
+    k = np.searchsorted(t, ns, side='right') - 1
+    kc = np.maximum(k, 0)
+    ok = (k >= 0) & (ns - t[kc] <= tolerance * 1e9)
+    return np.where(ok, p[kc], np.nan)
+
+
+def absolute(df, tolerance=120.0):
+    """
+    Add the atmospheric pressure as a PATM column to a dataframe indexed by
+    datetime, along with PIT700_abs and PIT780_abs absolute pressures for the
+    gauge columns in the dataframe. The gauge columns must be the raw values.
+    """
+    df = df.copy()
+    df['PATM'] = ambient(df.index, tolerance)
+    for g in gauges:
+        if g in df.columns:
+            df[f'{g}_abs'] = df[g] + df['PATM']
+    return df
+
+
+def daily_stats():
+    """
+    Min, max, mean, standard deviation, and number of readings of the
+    atmospheric pressure for each day in the index.
+    """
+    import pandas as pd
+
+    t, p = load_index()
+    s = pd.Series(p, index=pd.DatetimeIndex(t.view('datetime64[ns]'), name='date'))
+    return s.groupby(s.index.normalize()).agg(['min', 'max', 'mean', 'std', 'count'])
+
+
+def item_pressures(items, tolerance=120.0):
+    """
+    Mean ambient and absolute PIT700 and PIT780 pressures for each item. The
+    timestamps of all the items are joined onto the index together with one
+    `ambient` call.
+
+    Returns
+    -------
+    df : dataframe
+        Mean PATM, PIT700_abs, PIT780_abs, and the fraction of the samples
+        with an ambient reading for each item.
+    """
+    import pandas as pd
+    from utils import read_processed
+
+    frames = [read_processed(item, 'h0m', gauges, raw=True) for item in items]
+    patm = ambient(np.concatenate([df.index.to_numpy(dtype='datetime64[ns]') for df in frames]), tolerance)
+    bounds = np.cumsum([0] + [len(df) for df in frames])
+
+    rows = []
+    for item, df, lo, hi in zip(items, frames, bounds[:-1], bounds[1:]):
+        p = patm[lo:hi]
+        ok = ~np.isnan(p)
+        row = {'item': item, 'PATM': p[ok].mean() if ok.any() else np.nan}
+        for g in gauges:
+            row[f'{g}_abs'] = np.nanmean(df[g].to_numpy() + p) if ok.any() else np.nan
+        row['matched'] = ok.mean() if len(p) else np.nan
+        rows.append(row)
+
+    return pd.DataFrame(rows).set_index('item')
@@ -1,111 +1,789 @@
 """
 Process the original hydrodynamics data and write to a CSV file for model
 development. CSV files are written to the `processed-hydro` directory.
+
+If pyarrow is installed, each item is also written to a Parquet file in the
+`cache-hydro` directory. The `cache-hydro/h00`, `cache-hydro/h0m`, and
+`cache-hydro/h19` directories are columnar tables for each historian where the
+file name is the item number and the index is the datetime of the measurement.
+
+Each day file in `original-hydro` is parsed once and the windows for every item
+recorded on that day are sliced from the parsed data. Independent day files are
+processed in parallel by a pool of worker processes.
+
+A manifest in `cache-hydro/manifest.json` records a hash of each original file
+along with the item window and column parameters used for each processed file.
+Processed files are only written again when their inputs have changed.
+
+Large historian files can be streamed in chunks of rows. Rows outside every
+item window are dropped from each chunk and the remaining rows are appended to
+the processed files for each item, so memory use depends on the chunk size
+instead of the size of the file.
+
+Processed files are written by writer threads while the next item or chunk is
+parsed. Each file is written to a temporary name in the same directory and
+renamed over the old file when it is complete, so an interrupted run never
+leaves a partly written file for the analysis programs to read.
+
+The h00 and h0m files start with a "Base Avg" row of baseline offsets for the
+sensors. The raw and baseline subtracted columns are read together. The
+subtracted columns are written as the processed data, and the baseline that was
+subtracted in the spreadsheet is found from the two blocks, rounded to the
+decimals of the subtracted columns, and saved to
+`processed-hydro/baselines.json`. The value in the "Base Avg" row is rounded
+for display so it is only kept as metadata. The raw values are available from
+the loader in `utils.py` by adding the baseline back.
+
+The memory-mapped store built by `sensor_store.py` is disabled when processed
+files are updated, until it is built again.
+
+The quality checks of `quality.py` run on the rows of each item as they are
+sliced from the parsed data, or chunk by chunk when streaming. Gaps,
+flatlines, spikes, values out of range or at the limit of the transmitter, and
+disagreement of the thermocouple pairs are written to
+`results-hydro/quality.csv` and the flagged rows to `cache-hydro/masks.csv`,
+which the stats leave out with the mask option.
+
+Examples
+--------
+
+Optional argument for number of worker processes, default is the number of
+CPUs on the machine. Use the force option to process all the files regardless
+of the manifest.
+
+>>> python process_hydro.py
+>>> python process_hydro.py --jobs 4
+>>> python process_hydro.py --force
+>>> python process_hydro.py --chunksize 100000
+>>> python process_hydro.py --writers 4
+
+Use the check option to compare the in-memory and streamed ingest of every
+file in temporary directories. It exits with an error if the processed files,
+baselines, or quality checks of the two modes are not the same.
+
+>>> python process_hydro.py --check --chunksize 997
 """
 
-import pandas as pd
+import contextlib
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+import instrument
+from instrument import count, stage
+from schema import historians, raw_columns
+from sensor_store import remove_index
 
 # Parameters
 # ----------------------------------------------------------------------------
 
-# each tuple in `condition` represents
-# (item number in exp. matrix, file name, start time, stop time)
-condition = (
-    (1, 'rd181211', '16:38', '16:54'),
-    (2, 'rd181211', '22:04', '22:17'),
-    (3, 'rd181211', '22:54', '23:06'),
-    (4, 'rd181211', '23:45', '23:56'),
-    (5, 'rd181219', '9:39', '9:55'),
-    (6, 'rd181219', '14:51', '15:06'),
-    (7, 'rd181219', '16:36', '16:51'),
-    (8, 'rd181219', '15:58', '16:13'),
-    (9, 'rd181210', '18:39', '18:57'),
-    (10, 'rd181210', '23:16', '23:31'),
-    (11, 'rd181210', '22:23', '22:38'),
-    (12, 'rd181210', '21:47', '22:02'),
-    (13, 'rd181218', '10:02', '10:15'),
-    (14, 'rd181218', '14:21', '14:36'),
-    (15, 'rd181218', '13:33', '13:45'),
-    (16, 'rd181218', '13:03', '13:16'),
-    (17, 'rd181217', '12:32', '12:47'),
-    (18, 'rd181217', '20:00', '20:12'),
-    (19, 'rd181217', '17:53', '18:05'),
-    (20, 'rd181217', '18:39', '18:51'),
-    (21, 'rd181218', '15:51', '16:05'),
-    (22, 'rd181218', '19:10', '19:24'),
-    (23, 'rd181218', '20:29', '20:41'),
-    (24, 'rd181218', '19:59', '20:12'),
-    (25, 'rd181210', '11:46', '11:58'),
-    (26, 'rd181210', '14:43', '15:00'),
-    (27, 'rd181210', '14:14', '14:30'),
-    (28, 'rd181210', '15:25', '15:40'),
-    (29, 'rd181212', '10:43', '10:59'),
-    (30, 'rd181213', '12:23', '12:39'),
-    (31, 'rd181213', '13:36', '13:54'),
-    (32, 'rd181213', '11:22', '11:37'),
-    (33, 'rd181213', '19:25', '19:40'),
-    (34, 'rd181214', '15:37', '15:47'),
-    (35, 'rd181214', '16:28', '16:40'),
-    (36, 'rd181214', '18:31', '18:43'),
-    (101, 'rd181219', '17:10', '17:20'),
-    (102, 'rd181219', '17:58', '18:07'),
-    (103, 'rd181219', '18:12', '18:21'),
-    (105, 'rd181219', '18:28', '18:33'),
-    (201, 'rd181220', '11:26', '11:36'),
-    (202, 'rd181220', '11:46', '11:56')
-)
-
-# Process Data
+# decimals of the baseline subtracted columns written by the spreadsheet, the
+# baseline found from them is rounded to the same decimals so it is the same
+# for any rows of the file
+baseline_decimals = 6
+
+# Functions
 # ----------------------------------------------------------------------------
 
-print('Save CSV files to processed-hydro directory')
 
-for i in range(len(condition)):
-    item = condition[i][0]
-    f00 = f'{condition[i][1]}_h00.csv'
-    f0m = f'{condition[i][1]}_h0m.csv'
-    f19 = f'{condition[i][1]}_h19.csv'
-    t0 = condition[i][2]
-    t1 = condition[i][3]
+def group_windows(condition):
+    """
+    Group the item windows in `condition` by day file name.
+
+    Parameters
+    ----------
+    condition : tuple
+        Tuples of (item number, file name, start time, stop time).
+
+    Returns
+    -------
+    windows : dict
+        Lists of (item number, start time, stop time) keyed by file name.
+    """
+    windows = {}
+    for item, fname, t0, t1 in condition:
+        windows.setdefault(fname, []).append((item, t0, t1))
+    return windows
+
+
+def file_size(path):
+    """
+    Size of the file in bytes, or zero if the file does not exist.
+    """
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+@contextlib.contextmanager
+def atomic(path):
+    """
+    Temporary path in the same directory as `path` which is renamed over
+    `path` when the body of the with statement finishes and removed if it
+    fails, so readers only ever see a complete file.
+
+    >>> with atomic('processed-hydro/001_rd181211_h0m.csv') as tmp:
+    ...     df.to_csv(tmp)
+    """
+    tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+
+
+def remove_temps(dirs=('processed-hydro', 'cache-hydro')):
+    """
+    Remove temporary files left by a run that was killed before it could
+    rename or remove them.
+    """
+    for d in dirs:
+        for root, _, files in os.walk(d):
+            for f in files:
+                if f.endswith('.tmp'):
+                    os.remove(os.path.join(root, f))
+
+
+def load_manifest(path='cache-hydro/manifest.json'):
+    """
+    Load the manifest of source hashes and processed file keys. An empty
+    manifest is returned if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {'sources': {}, 'outputs': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path='cache-hydro/manifest.json'):
+    """
+    Save the manifest of source hashes and processed file keys.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic(path) as tmp, open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+
+def source_hash(path, sources):
+    """
+    SHA-256 hash of an original data file. The hash is reused from the manifest
+    when the size and modification time of the file have not changed.
+
+    Parameters
+    ----------
+    path : str
+        Path to the original CSV file.
+    sources : dict
+        Source entries from the manifest, updated in place.
+    """
+    st = os.stat(path)
+    name = os.path.basename(path)
+    entry = sources.get(name)
+    if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+        return entry['sha256']
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    sources[name] = {'size': st.st_size, 'mtime': st.st_mtime_ns, 'sha256': h.hexdigest()}
+    return h.hexdigest()
+
+
+def output_key(sha, f, hist, t0, t1):
+    """
+    Key for a processed file from the hash of the original file, the item
+    window, and the column numbers, names, and datetime format of the
+    historian.
+    """
+    params = [sha, f, t0, t1] + list(historians[hist]) + [raw_columns.get(hist)]
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+
+def read_header(path, hist):
+    """
+    Read the two header lines of an original historian file. The first line is
+    the baseline row which contains the "Base Avg" values for the sensors. The
+    second line contains the column names which are checked against the column
+    names of the historian.
+
+    Parameters
+    ----------
+    path : str
+        Path to the original CSV file.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+
+    Returns
+    -------
+    base : list
+        Fields of the baseline row.
+    header : list
+        Column names in the file.
+    """
+    cols, names, _ = historians[hist]
+    with open(path, encoding='utf-8-sig') as f:
+        base = f.readline().rstrip('\r\n').split(',')
+        header = f.readline().rstrip('\r\n').split(',')
+    if [header[c] for c in cols[1:]] != names[1:]:
+        raise ValueError(f'Unexpected column names in {path}.')
+    if hist in raw_columns and [header[c] for c in raw_columns[hist]] != names[1:]:
+        raise ValueError(f'Unexpected raw column names in {path}.')
+    return base, header
+
+
+def find_baseline(raw, subtracted):
+    """
+    Baseline that was subtracted from each column in the spreadsheet, as the
+    median of the raw minus the subtracted values over the rows where all the
+    subtracted values are given, rounded to `baseline_decimals`. The values
+    are NaN if there are no such rows.
+    """
+    import numpy as np
+
+    diff = raw - subtracted
+    rows = ~np.isnan(diff).any(axis=1)
+    if not rows.any():
+        return np.full(raw.shape[1], np.nan)
+    return np.round(np.median(diff[rows], axis=0), baseline_decimals) + 0.0
+
+
+def baseline_table(base, hist, found):
+    """
+    Baseline metadata for each sensor of a historian file. The base_avg is the
+    value in the "Base Avg" row of the file, which is rounded for display, and
+    the baseline is the value subtracted from the raw data. The baseline is the
+    one found in the spreadsheet columns, or the base_avg if it was not found.
+    """
+    import numpy as np
+
+    names = historians[hist][1][1:]
+    table = {}
+    for name, c, value in zip(names, raw_columns[hist], found):
+        base_avg = float(base[c]) if base[c] else 0.0
+        table[name] = {'base_avg': base_avg, 'baseline': base_avg if np.isnan(value) else float(value)}
+    return table
+
+
+def usecols(hist):
+    """
+    Column numbers to read from an original historian file. Files with a
+    "Base Avg" row are read with the raw columns followed by the baseline
+    subtracted columns.
+    """
+    cols = historians[hist][0]
+    return cols + raw_columns[hist] if hist in raw_columns else cols
+
+
+def apply_baseline(df, hist, base, baseline=None):
+    """
+    Baseline corrected data of an original historian file. The corrected
+    values are the baseline subtracted columns of the spreadsheet, so they are
+    not changed by the floating point error of subtracting the baseline again,
+    and the raw columns are only used to find the baseline. Rows are the ones
+    where the spreadsheet has baseline subtracted values, so rows that were
+    removed in the spreadsheet are not used.
+
+    Parameters
+    ----------
+    df : dataframe
+        Data read with `usecols` where the columns are the column numbers.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    base : list
+        Fields of the baseline row of the file.
+    baseline : dict, optional
+        Baseline metadata for each sensor. It is found from the data if not
+        given.
+
+    Returns
+    -------
+    df : dataframe
+        Baseline corrected data with the sensor names as columns.
+    baseline : dict
+        Baseline metadata for each sensor, empty if the file does not have a
+        "Base Avg" row.
+    """
+    cols, names, _ = historians[hist]
+    if hist not in raw_columns:
+        return df.set_axis(names, axis=1), {}
+
+    df = df.dropna()
+    if baseline is None:
+        values = df[raw_columns[hist]].to_numpy(dtype=float)
+        baseline = baseline_table(base, hist, find_baseline(values, df[cols[1:]].to_numpy(dtype=float)))
+
+    out = df[cols].set_axis(names, axis=1)
+    return out, baseline
+
+
+def load_baselines(path='processed-hydro/baselines.json'):
+    """
+    Load the baseline metadata for each original file such as rd181210_h0m.
+    An empty table is returned if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(baselines, path='processed-hydro/baselines.json'):
+    """
+    Save the baseline metadata for each original file.
+    """
+    with atomic(path) as tmp, open(tmp, 'w') as f:
+        json.dump(baselines, f, indent=1, sort_keys=True)
+
+
+def parse_datetime(values, fmt):
+    """
+    Parse the DateTime column of a historian file. The format is detected from
+    the first value, the historian format is used if it can not be detected.
+    """
+    from timestamps import detect_format, parse_timestamps
+
+    if len(values):
+        fmt = detect_format(values[0]) or fmt
+    return parse_timestamps(values, fmt).view('datetime64[ns]')
+
+
+def read_historian(path, hist):
+    """
+    Read an original historian CSV file into a dataframe indexed by datetime.
+    For files with a "Base Avg" row the raw columns are read and the baseline
+    is subtracted. The baseline metadata is kept in the `baseline` entry of
+    the dataframe attrs.
+
+    Parameters
+    ----------
+    path : str
+        Path to the original CSV file.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    """
+    import pandas as pd
+
+    _, _, fmt = historians[hist]
+    base, _ = read_header(path, hist)
+    with stage('read_csv'):
+        df = pd.read_csv(path, header=None, skiprows=2, usecols=usecols(hist))
+    count(os.path.basename(path)[:-4], bytes_read=file_size(path), rows_parsed=len(df))
+    with stage('baseline'):
+        df, baseline = apply_baseline(df, hist, base)
+        df = df.dropna()
+    with stage('to_datetime'):
+        df['DateTime'] = parse_datetime(df['DateTime'].to_numpy(), fmt)
+        df = df.set_index(['DateTime'])
+    df.attrs['baseline'] = baseline
+    return df
+
+
+def write_store(df, item, hist, store='cache-hydro'):
+    """
+    Write the data for an item to the columnar store. Nothing is written if
+    pyarrow is not available.
+
+    Parameters
+    ----------
+    df : dataframe
+        Processed data for the item indexed by datetime.
+    item : int
+        Item number in the experimental matrix.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    store : str
+        Directory of the columnar store.
+    """
+    if importlib.util.find_spec('pyarrow') is None:
+        return
+    os.makedirs(os.path.join(store, hist), exist_ok=True)
+    with stage('to_parquet'), atomic(os.path.join(store, hist, f'{item:03g}.parquet')) as tmp:
+        df.to_parquet(tmp)
+
+
+def write_item(df, item, hist, path, store='cache-hydro'):
+    """
+    Write the data for an item to its processed CSV file and the columnar
+    store. Each file is written to a temporary name and renamed when it is
+    complete.
+    """
+    with stage('to_csv'), atomic(path) as tmp:
+        df.to_csv(tmp)
+    write_store(df, item, hist, store)
+
+
+def submit(pool, pending, depth, fn, *args):
+    """
+    Submit a write to the pool of writer threads. The oldest write is waited
+    on when `depth` writes are pending, so parsing can run ahead of the
+    writes without holding every item in memory. The write is done right
+    away if there is no pool.
+    """
+    if pool is None:
+        fn(*args)
+        return
+    while len(pending) >= depth:
+        pending.popleft().result()
+    pending.append(pool.submit(fn, *args))
+
+
+def writer_pool(writers):
+    """
+    Pool of writer threads, or a null context for writes on the calling
+    thread when `writers` is zero.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=writers, thread_name_prefix='writer') if writers else contextlib.nullcontext()
+
+
+def stream_historian(path, hist, windows, dst, chunksize, writers=1, store='cache-hydro'):
+    """
+    Read an original historian CSV file in chunks and append the rows in each
+    item window to the processed CSV file and columnar store for the item.
+    The rows are appended by a writer thread while the next chunk is parsed.
+    Files are written to temporary names and renamed when the whole file has
+    been read, or removed if it fails.
+
+    Parameters
+    ----------
+    path : str
+        Path to the original CSV file.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    windows : list
+        Tuples of (item number, start time, stop time) for the day.
+    dst : str
+        Directory of the processed data files.
+    chunksize : int
+        Number of rows in each chunk.
+    writers : int
+        Append the rows on a writer thread if not zero. One thread is used
+        so the chunks of each item are appended in order.
+    store : str
+        Directory of the columnar store.
+
+    Returns
+    -------
+    nrows : int
+        Number of parsed rows in the file.
+    baseline : dict
+        Baseline metadata for each sensor, empty if the file does not have a
+        "Base Avg" row.
+    checks : list
+        Tuples of masks and report of the quality checks for each item.
+    """
+    import pandas as pd
+    import quality
+
+    try:
+        import pyarrow
+        import pyarrow.parquet as pq
+    except ImportError:
+        pyarrow = None
+
+    _, names, fmt = historians[hist]
+    base, _ = read_header(path, hist)
+    baseline = None
+    f = os.path.basename(path)
+
+    # quality checks of each item carry the last rows over to the next chunk
+    scans = {item: quality.new_scan(f'{item:03g}', hist) for item, _, _ in windows}
+
+    # start and stop times as time of day, inclusive like `between_time`
+    bounds = [(item, pd.Timedelta(f'{t0}:00'), pd.Timedelta(f'{t1}:00')) for item, t0, t1 in windows]
+    csvs = {}
+    stores = {}
+    nrows = 0
+
+    def append(df_item, item):
+        # temporary files are opened on the first rows for each item and are
+        # renamed when the exit stack is closed
+        with stage('to_csv'):
+            if item not in csvs:
+                tmp = stack.enter_context(atomic(os.path.join(dst, f'{item:03g}_{f}')))
+                csvs[item] = stack.enter_context(open(tmp, 'w', newline=''))
+                df_item.to_csv(csvs[item])
+            else:
+                df_item.to_csv(csvs[item], header=False)
+        if pyarrow is not None:
+            with stage('to_parquet'):
+                table = pyarrow.Table.from_pandas(df_item)
+                if item not in stores:
+                    os.makedirs(os.path.join(store, hist), exist_ok=True)
+                    tmp = stack.enter_context(atomic(os.path.join(store, hist, f'{item:03g}.parquet')))
+                    stores[item] = stack.enter_context(pq.ParquetWriter(tmp, table.schema))
+                stores[item].write_table(table)
+
+    reader = pd.read_csv(path, header=None, skiprows=2, usecols=usecols(hist), chunksize=chunksize)
+    pending = deque()
+
+    with contextlib.ExitStack() as stack, writer_pool(min(writers, 1)) as pool, reader:
+        while True:
+            with stage('read_csv'):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            count(f[:-4], rows_parsed=len(chunk))
+            chunk = chunk.dropna()
+            if chunk.empty:
+                continue
+            # the baseline is found from the first chunk with rows, it is
+            # rounded so it is the same as the one from the whole file
+            with stage('baseline'):
+                chunk, baseline = apply_baseline(chunk, hist, base, baseline)
+            with stage('to_datetime'):
+                chunk['DateTime'] = parse_datetime(chunk['DateTime'].to_numpy(), fmt)
+                chunk = chunk.set_index(['DateTime'])
+            nrows += len(chunk)
+
+            tod = chunk.index - chunk.index.normalize()
+            for item, t0, t1 in bounds:
+                with stage('between_time'):
+                    mask = (tod >= t0) & (tod <= t1)
+                if not mask.any():
+                    continue
+                df_item = chunk[mask]
+                count(f'{item:03g}_{hist}', rows_kept=len(df_item))
+                with stage('quality'):
+                    quality.update(scans[item], df_item)
+                submit(pool, pending, 8, append, df_item, item)
+
+        for fut in pending:
+            fut.result()
+
+    # items without any rows in the window still get a file with a header
+    empty = pd.DataFrame(columns=names[1:], index=pd.DatetimeIndex([], name='DateTime'), dtype=float)
+    for item, _, _ in windows:
+        if item not in csvs:
+            write_item(empty, item, hist, os.path.join(dst, f'{item:03g}_{f}'), store)
+
+    if baseline is None:
+        _, baseline = apply_baseline(pd.DataFrame(columns=usecols(hist)), hist, base)
+    count(f[:-4], bytes_read=file_size(path))
+    return nrows, baseline, [quality.finish(scans[item]) for item, _, _ in windows]
+
+
+def process_file(fname, hist, windows, src='original-hydro', dst='processed-hydro', chunksize=None, writers=2, store='cache-hydro'):
+    """
+    Parse one day file for a historian and write the data for each item window
+    to the processed directory. The files for each item are written by a pool
+    of writer threads while the next item is sliced from the parsed data.
+
+    Parameters
+    ----------
+    fname : str
+        Day file name such as rd181210.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    windows : list
+        Tuples of (item number, start time, stop time) for the day.
+    src : str
+        Directory of the original data files.
+    dst : str
+        Directory of the processed data files.
+    chunksize : int, optional
+        Number of rows in each chunk when streaming the file. The whole file is
+        read at once if not given.
+    writers : int
+        Number of writer threads, the files are written on the calling thread
+        if zero.
+    store : str
+        Directory of the columnar store.
+
+    Returns
+    -------
+    tuple
+        File name, number of parsed rows, number of items written, elapsed
+        time in seconds, baseline metadata for each sensor, and tuples of
+        masks and report of the quality checks for each item. Number of rows
+        is None if the file does not exist.
+    """
+    import quality
+
+    tic = time.perf_counter()
+    f = f'{fname}_{hist}.csv'
+    path = os.path.join(src, f)
+
+    if not os.path.exists(path):
+        return f, None, 0, time.perf_counter() - tic, {}, []
+
+    if chunksize:
+        nrows, baseline, checks = stream_historian(path, hist, windows, dst, chunksize, writers, store)
+        return f, nrows, len(windows), time.perf_counter() - tic, baseline, checks
+
+    df = read_historian(path, hist)
+    pending = deque()
+    checks = []
+
+    with writer_pool(writers) as pool:
+        for item, t0, t1 in windows:
+            with stage('between_time'):
+                df_item = df.between_time(t0, t1)
+            count(f'{item:03g}_{hist}', rows_kept=len(df_item))
+            with stage('quality'):
+                checks.append(quality.scan_item(df_item, f'{item:03g}', hist))
+            submit(pool, pending, 2 * writers, write_item, df_item, item, hist, os.path.join(dst, f'{item:03g}_{f}'), store)
+        for fut in pending:
+            fut.result()
+
+    return f, len(df), len(windows), time.perf_counter() - tic, df.attrs['baseline'], checks
+
+
+def check_modes(chunksize, src='original-hydro'):
+    """
+    Process every day file both in memory and streamed in chunks into
+    temporary directories and compare the two modes, which should write the
+    same processed files, baselines, and quality checks. The processed data
+    and stores of the repository are not changed.
+
+    Returns
+    -------
+    diffs : list
+        Names of the outputs that are not the same, empty if the modes agree.
+    """
+    import filecmp
+    import tempfile
+    from registry import conditions
+
+    diffs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        mem, stream = os.path.join(tmp, 'memory'), os.path.join(tmp, 'stream')
+        os.makedirs(mem)
+        os.makedirs(stream)
+
+        for fname, windows in group_windows(conditions()).items():
+            for hist in historians:
+                a = process_file(fname, hist, windows, src, mem, None, 0, os.path.join(tmp, 'memory-store'))
+                b = process_file(fname, hist, windows, src, stream, chunksize, 0, os.path.join(tmp, 'stream-store'))
+                if a[1] is None:
+                    continue
+                if a[1] != b[1]:
+                    diffs.append(f'{a[0]} rows')
+                if json.dumps(a[4], sort_keys=True) != json.dumps(b[4], sort_keys=True):
+                    diffs.append(f'{a[0]} baseline')
+                for (item, _, _), (ma, ra), (mb, rb) in zip(windows, a[5], b[5]):
+                    if not (ma.equals(mb) and ra.equals(rb)):
+                        diffs.append(f'{item:03g}_{a[0]} quality checks')
+
+        for f in sorted(os.listdir(mem)):
+            other = os.path.join(stream, f)
+            if not os.path.exists(other) or not filecmp.cmp(os.path.join(mem, f), other, shallow=False):
+                diffs.append(f)
+    return diffs
+
+
+def run(args):
+    """
+    Process all the day files in parallel and report timing for each file.
+    The arguments are the jobs, force, chunksize, writers, and check options
+    of the ingest subcommand in `riser.py`. With the check option the two
+    ingest modes are compared by `check_modes` and nothing is written.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import quality
+    from registry import conditions
+
+    if args.check:
+        chunksize = args.chunksize or 10000
+        print(f'Compare in-memory and streamed ingest in chunks of {chunksize} rows ... ', end='', flush=True)
+        diffs = check_modes(chunksize)
+        if diffs:
+            print('Failed.')
+            for d in diffs:
+                print(f'  {d} is not the same')
+            sys.exit(1)
+        print('Complete.')
+        return
+
+    print('Save CSV files to processed-hydro directory')
+    tic = time.perf_counter()
 
-    print(f'Process h00, h0m, and h19 files for item {item} ... ', end='')
+    remove_temps()
+    manifest = load_manifest()
+    baselines = load_baselines()
+    done = {} if args.force else manifest['outputs']
 
-    # h00 -------------
+    # items without a quality report are checked again
+    report = quality.load_report()
+    checked = set(zip(report['item'], report['hist']))
 
-    c00 = [0, 6, 7, 8]
-    n00 = ['DateTime', 'PDIT705', 'PDIT706', 'PDIT707']
-    df_h00 = pd.read_csv(f'original-hydro/{f00}', names=n00, skiprows=2, usecols=c00)
+    # only the item windows with a changed key are processed for each file
+    keys = {}
+    tasks = []
+    nskip = 0
 
-    df_h00 = df_h00.dropna()
-    df_h00['DateTime'] = pd.to_datetime(df_h00['DateTime'], format='%m/%d/%Y %H:%M:%S.%f')
-    df_h00 = df_h00.set_index(['DateTime']).between_time(t0, t1)
+    for fname, windows in group_windows(conditions()).items():
+        for hist in historians:
+            f = f'{fname}_{hist}.csv'
+            path = f'original-hydro/{f}'
+            if not os.path.exists(path):
+                print(f'Skip {f}, file not found.')
+                continue
+            sha = source_hash(path, manifest['sources'])
+            stale = []
+            for item, t0, t1 in windows:
+                out = f'{item:03g}_{f}'
+                keys[out] = output_key(sha, f, hist, t0, t1)
+                if done.get(out) == keys[out] and os.path.exists(f'processed-hydro/{out}') and (f'{item:03g}', hist) in checked:
+                    nskip += 1
+                else:
+                    stale.append((item, t0, t1))
+            if stale:
+                tasks.append((fname, hist, stale))
+            else:
+                print(f'Skip {f}, {len(windows)} items up to date.')
 
-    df_h00.to_csv(f'processed-hydro/{item:03g}_{f00}')
+    # largest files first so long parses do not end up at the back of the queue
+    tasks.sort(key=lambda t: file_size(f'original-hydro/{t[0]}_{t[1]}.csv'), reverse=True)
 
-    # h0m -------------
+    outputs = {out: key for out, key in done.items() if keys.get(out) == key}
+    masks = []
+    reports = []
 
-    c0m = [0] + list(range(13, 23))
-    n0m = ['DateTime', 'FIT600', 'FT702', 'FT750', 'PIT700', 'PIT780', 'PDIT700', 'PDIT704', 'PDIT780', 'ZC742', 'ZC762']
-    df_h0m = pd.read_csv(f'original-hydro/{f0m}', names=n0m, skiprows=2, usecols=c0m)
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(instrument.call, process_file, *t, chunksize=args.chunksize, writers=args.writers): t for t in tasks}
+        for fut in as_completed(futures):
+            fname, hist, windows = futures[fut]
+            (f, nrows, nitems, elapsed, baseline, checks), snap = fut.result()
+            instrument.merge(snap)
+            print(f'Process {f} ... {nrows} rows, {nitems} items in {elapsed:.2f} s')
+            if baseline:
+                baselines[f'{fname}_{hist}'] = baseline
+            for df_masks, df_report in checks:
+                masks.append(df_masks)
+                reports.append(df_report)
+            for item, _, _ in windows:
+                out = f'{item:03g}_{f}'
+                outputs[out] = keys[out]
 
-    df_h0m = df_h0m.dropna()
-    df_h0m['DateTime'] = pd.to_datetime(df_h0m['DateTime'], format='%m/%d/%Y %H:%M:%S')
-    df_h0m = df_h0m.set_index(['DateTime']).between_time(t0, t1)
+    manifest['outputs'] = outputs
+    save_manifest(manifest)
+    save_baselines(baselines)
 
-    df_h0m.to_csv(f'processed-hydro/{item:03g}_{f0m}')
+    if reports:
+        redone = {(f'{item:03g}', hist) for fname, hist, windows in tasks for item, _, _ in windows}
+        _, df_report = quality.save(masks, reports, redone)
+        flagged = df_report[df_report['masked'] > 0]
+        print(f'Quality checks masked {flagged["masked"].sum()} rows of {len(flagged)} item sensors, see {quality.report_path}.')
 
-    # h19 -------------
+    if tasks:
+        remove_index()
+        print('Run sensor_store.py to update the memory-mapped store.')
 
-    c19 = [0] + list(range(3, 26))
-    n19 = ['DateTime', 'TE629', 'TE701', 'TE705', 'TE706A_1', 'TE706A_2', 'TE706B_1', 'TE706B_2', 'TE706C_1', 'TE706C_2', 'TE707A', 'TE707B', 'TE707C', 'TE708A_1', 'TE708A_2', 'TE708B_1', 'TE708B_2', 'TE708C_1', 'TE708C_2', 'TE709A', 'TE709B', 'TE709C', 'TE741A', 'TE743']
-    df_h19 = pd.read_csv(f'original-hydro/{f19}', names=n19, skiprows=2, usecols=c19)
+    print(f'Skipped {nskip} processed files that are up to date.')
+    print(f'Done in {time.perf_counter() - tic:.2f} s.')
 
-    df_h19 = df_h19.dropna()
-    df_h19['DateTime'] = pd.to_datetime(df_h19['DateTime'])
-    df_h19 = df_h19.set_index(['DateTime']).between_time(t0, t1)
 
-    df_h19.to_csv(f'processed-hydro/{item:03g}_{f19}')
+def main():
+    import riser
+    riser.main(['ingest', *sys.argv[1:]])
 
-    print('Complete.')
 
-print('Done.')
+if __name__ == '__main__':
+    main()
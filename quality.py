@@ -0,0 +1,439 @@
+"""
+Data quality checks of the processed data, which run on each item window as
+the original files are parsed by `process_hydro.py`. The checks are
+
+gap         time between samples is more than `gap_factor` times the cadence
+flat        value has not changed for `flat_seconds` of samples
+spike       value is more than `spike_k` noise levels from the medians of the
+            samples before it and the samples after it, on the same side
+range       value is outside the limits of the sensor
+clip        value is at the upper limit of a transmitter in `full_scale`
+pair        difference of a redundant _1 and _2 thermocouple pair has a spike
+            or is more than `pair_limit`
+
+A spike has to come back, so a step in the level of a sensor is not flagged
+since the values after the step are close to the median of the samples after
+them. The noise level of the spike check is the median of the absolute
+differences between consecutive samples in the same centred window, so it
+works for quantized sensors and needs only a few samples. The first and last
+three samples of an item are not checked for spikes.
+
+The spike check looks `spike_seconds` / 2 ahead, so when a file is streamed in
+chunks the last rows of each item wait for the next chunk before their flags
+are kept, and the rows before them are carried over as the window of the
+checks. The flags are the same as when the whole item is scanned at once.
+
+Rows flagged by the flat, spike, range, clip, and pair checks are saved as
+time intervals for each item and sensor in `cache-hydro/masks.csv`. The number
+of gaps and flagged rows for each item and sensor is written to
+`results-hydro/quality.csv`. Rows in the intervals are left out of the stats
+by `load_long` in `stats_hydro.py` and `load_items` in `utils.py` with the
+mask option, and kept by default.
+
+Examples
+--------
+>>> from quality import apply_masks, load_masks
+>>> df_long = apply_masks(df_long, load_masks())
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from schema import cadence, historians
+from steady import runs
+
+masks_path = os.path.join('cache-hydro', 'masks.csv')
+report_path = os.path.join('results-hydro', 'quality.csv')
+
+# checks that mask rows of a sensor, gaps are between rows so they are only
+# counted in the report
+checks = ('flat', 'spike', 'range', 'clip', 'pair')
+
+# largest time between samples as a multiple of the cadence
+gap_factor = 5.0
+
+# valve outputs of the controllers are constant with steps by design so they
+# are not checked for flatlines and spikes
+exempt = ('ZC742', 'ZC762')
+
+# shortest time without a change in value for a flatline
+flat_seconds = {'h00': 30.0, 'h0m': 120.0, 'h19': 600.0}
+
+# centred window for the medians and noise level of the spike check, half of
+# it before and half after each sample, and the largest distance from the
+# medians as a multiple of the noise level
+spike_seconds = {'h00': 10.0, 'h0m': 60.0, 'h19': 600.0}
+spike_k = 20.0
+
+# lowest value, highest value, and smallest noise level for the sensors with
+# each prefix, pressures in kPa, temperatures in K, and valve outputs in %
+limits = {
+    'PDIT': (-1.0, 20.0, 0.005),
+    'PIT': (-20.0, 100.0, 0.05),
+    'FIT': (0.0, 1000.0, 0.1),
+    'FT': (0.0, 1000.0, 0.5),
+    'ZC': (0.0, 100.0, 0.1),
+    'TE': (250.0, 1100.0, 0.5)
+}
+
+# upper limit of the transmitters that saturate in the data, PDIT700 reads at
+# most 2.1302 kPa and stays there for most of the last minutes of item 105,
+# values within one noise level of the limit are flagged
+full_scale = {'PDIT700': 2.13}
+
+# largest difference of a thermocouple pair in K, the pairs have offsets of
+# up to ~60 K during normal operation
+pair_limit = 100.0
+
+# masks for each item and sensor along with the modification time of the file
+_masks = {}
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def sensor_limits(name):
+    """
+    Lowest value, highest value, and smallest noise level of a sensor such as
+    PDIT700 from the limits of its prefix.
+    """
+    return limits[re.match(r'\D+', name).group()]
+
+
+def sensor_pairs(names):
+    """
+    Column numbers of the redundant thermocouple pairs such as TE706A_1 and
+    TE706A_2 in a list of sensor names.
+    """
+    pos = {n: k for k, n in enumerate(names)}
+    return [(pos[n], pos[n[:-1] + '2']) for n in names if n.endswith('_1') and n[:-1] + '2' in pos]
+
+
+def window_rows(hist):
+    """
+    Number of rows for the flat check and for each side of the spike check
+    of a historian, and the number of rows carried over before and held back
+    at the end of each chunk of an item.
+    """
+    flat = max(int(np.ceil(flat_seconds[hist] / cadence[hist])), 2)
+    half = max(int(np.ceil(spike_seconds[hist] / cadence[hist] / 2)), 3)
+    return flat, half, max(flat - 1, half + 1), half
+
+
+def spikes(values, h, floor):
+    """
+    Distance of each value from the medians of the `h` values before it and
+    the `h` values after it as a multiple of the noise level, which is the
+    median absolute difference of consecutive values in the centred window
+    and is at least `floor`. The distance is the smaller of the two and zero
+    if the value is between the medians, so a step is not a spike. The first
+    and last three values of an item are NaN.
+    """
+    df = pd.DataFrame(values)
+    before = df.rolling(h, min_periods=3).median().shift(1).to_numpy()
+    after = df[::-1].rolling(h, min_periods=3).median().shift(1)[::-1].to_numpy()
+    noise = df.diff().abs().rolling(2 * h + 1, min_periods=3, center=True).median()
+    noise = np.maximum(noise.to_numpy(), floor)
+    a = values - before
+    b = values - after
+    return np.where(a * b > 0, np.minimum(np.abs(a), np.abs(b)), np.where(np.isnan(a * b), np.nan, 0.0)) / noise
+
+
+def flatlines(values, n):
+    """
+    True where a value is the same as the `n - 1` values before it.
+    """
+    rows = np.arange(len(values))[:, None]
+    change = np.ones(values.shape, dtype=bool)
+    change[1:] = values[1:] != values[:-1]
+    last = np.maximum.accumulate(np.where(change, rows, 0), axis=0)
+    return rows - last + 1 >= n
+
+
+def flags(ns, values, names, hist):
+    """
+    Flags of each check for the rows of an item.
+
+    Parameters
+    ----------
+    ns : array
+        Timestamps as int64 nanoseconds.
+    values : array
+        Sensor values of shape (rows, sensors).
+    names : list
+        Sensor name of each column.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+
+    Returns
+    -------
+    gap : array
+        True for rows that follow a gap.
+    flagged : dict
+        Boolean array of shape (rows, sensors) for each check.
+    """
+    nflat, half, _, _ = window_rows(hist)
+    lo, hi, floor = np.array([sensor_limits(n) for n in names]).T
+    top = np.array([full_scale.get(n, np.inf) for n in names])
+
+    gap = np.zeros(len(ns), dtype=bool)
+    gap[1:] = np.diff(ns) > gap_factor * cadence[hist] * 1e9
+
+    with np.errstate(invalid='ignore'):
+        checked = ~np.isin(names, exempt)
+        flat = flatlines(values, nflat) & checked
+        spike = (spikes(values, half, floor) > spike_k) & checked
+        out = (values < lo) | (values > hi)
+        clip = values >= top - floor
+
+        pair = np.zeros(values.shape, dtype=bool)
+        for a, b in sensor_pairs(names):
+            d = values[:, [a]] - values[:, [b]]
+            bad = (spikes(d, half, floor[a]) > spike_k) | (np.abs(d) > pair_limit)
+            pair[:, a] |= bad[:, 0]
+            pair[:, b] |= bad[:, 0]
+
+    return gap, {'flat': flat, 'spike': spike, 'range': out, 'clip': clip, 'pair': pair}
+
+
+def new_scan(item, hist, names=None):
+    """
+    State of the checks for an item, which is updated with each chunk of rows
+    of the item by `update` and turned into masks and a report by `finish`.
+    """
+    names = list(historians[hist][1][1:] if names is None else names)
+    return {
+        'item': item, 'hist': hist, 'names': names, 'rows': 0, 'done': 0, 'gaps': 0, 'gap_s': 0.0,
+        'counts': np.zeros((len(checks) + 1, len(names)), dtype=np.int64),
+        'tail': (np.empty(0, np.int64), np.empty((0, len(names)))), 'intervals': []
+    }
+
+
+def update(scan, df=None, last=False):
+    """
+    Run the checks on the next rows of an item, given as a dataframe indexed
+    by datetime with the sensor columns. The rows carried over from the last
+    update are put in front so the checks see the samples before the chunk,
+    and the flags of the last rows are kept at the next update when the
+    samples after them are known, or now if `last` is True.
+
+    Returns
+    -------
+    ns : array
+        Timestamps of the rows whose flags were kept by this update.
+    values : array
+        Values of those rows of shape (rows, sensors).
+    """
+    item, hist, names = scan['item'], scan['hist'], scan['names']
+    ns, values = scan['tail']
+    if df is not None and not df.empty:
+        ns = np.concatenate([ns, df.index.to_numpy(dtype='datetime64[ns]').view(np.int64)])
+        values = np.concatenate([values, df[names].to_numpy(dtype=float)])
+        scan['rows'] += len(df)
+
+    # rows before k were kept by earlier updates and rows from end on wait
+    # for the samples after them
+    _, _, back, ahead = window_rows(hist)
+    k = len(ns) - (scan['rows'] - scan['done'])
+    end = len(ns) if last else max(len(ns) - ahead, k)
+    offset = scan['done'] - k
+
+    if end > k:
+        gap, flagged = flags(ns, values, names, hist)
+        for g in np.flatnonzero(gap[k:end]) + k:
+            scan['intervals'].append((item, hist, 'DateTime', 'gap', ns[g - 1], ns[g], 0, offset + g, offset + g))
+            scan['gap_s'] += (ns[g] - ns[g - 1]) / 1e9
+        scan['gaps'] += int(gap[k:end].sum())
+
+        masked = np.zeros(values.shape, dtype=bool)
+        for c, check in enumerate(checks):
+            f = flagged[check]
+            masked |= f
+            scan['counts'][c] += f[k:end].sum(axis=0)
+            for j, name in enumerate(names):
+                for i0, i1 in zip(*runs(f[k:end, j])):
+                    i0 += k
+                    i1 += k
+                    scan['intervals'].append((item, hist, name, check, ns[i0], ns[i1 - 1], i1 - i0, offset + i0, offset + i1))
+        scan['counts'][-1] += masked[k:end].sum(axis=0)
+        scan['done'] += end - k
+
+    keep = max(end - back, 0)
+    scan['tail'] = (ns[keep:], values[keep:])
+    return ns[k:end], values[k:end]
+
+
+def pending(scan):
+    """
+    Timestamps and values of the rows of an item whose flags wait for the
+    samples after them.
+    """
+    n = scan['rows'] - scan['done']
+    ns, values = scan['tail']
+    return ns[len(ns) - n:], values[len(ns) - n:]
+
+
+def close(scan):
+    """
+    Copy of the state of the checks for an item with the flags of the rows
+    that wait for the samples after them kept as the last rows of the item.
+    The state itself is not changed so more rows can be added to it.
+    """
+    scan = {**scan, 'counts': scan['counts'].copy(), 'intervals': list(scan['intervals'])}
+    update(scan, last=True)
+    return scan
+
+
+def finish(scan):
+    """
+    Masks and report of an item from the state of its checks, with the rows
+    that wait for the samples after them checked as the last rows of the
+    item. Flagged rows of one sensor and check that run from one chunk into
+    the next are joined into one interval.
+
+    Returns
+    -------
+    df_masks : dataframe
+        Item, historian, sensor, check, start, stop, and number of rows of
+        each interval of flagged rows and each gap.
+    df_report : dataframe
+        Number of rows, gaps, seconds of gaps, rows flagged by each check, and
+        masked rows for each sensor of the item.
+    """
+    scan = close(scan)
+    cols = ['item', 'hist', 'sensor', 'check', 'start', 'stop', 'rows', 'row0', 'row1']
+    df = pd.DataFrame(scan['intervals'], columns=cols)
+    if len(df):
+        # intervals that start where the last one of the sensor and check
+        # stopped are continued from the previous chunk
+        df = df.sort_values(['sensor', 'check', 'row0'], kind='stable')
+        new = (df['row0'] != df['row1'].shift()) | (df['sensor'] != df['sensor'].shift()) | (df['check'] != df['check'].shift())
+        new |= df['check'] == 'gap'
+        df = df.groupby(new.cumsum().to_numpy(), sort=False).agg(
+            item=('item', 'first'), hist=('hist', 'first'), sensor=('sensor', 'first'), check=('check', 'first'),
+            start=('start', 'first'), stop=('stop', 'last'), rows=('rows', 'sum')
+        ).sort_values(['start', 'sensor'], kind='stable')
+    df_masks = df[cols[:7]].reset_index(drop=True)
+    df_masks['start'] = pd.to_datetime(df_masks['start'].astype(np.int64))
+    df_masks['stop'] = pd.to_datetime(df_masks['stop'].astype(np.int64))
+
+    n = scan['rows']
+    df_report = pd.DataFrame({
+        'item': scan['item'], 'hist': scan['hist'], 'sensor': scan['names'], 'rows': n,
+        'gaps': scan['gaps'], 'gap_s': scan['gap_s'],
+        **{check: scan['counts'][c] for c, check in enumerate(checks)},
+        'masked': scan['counts'][-1]
+    })
+    df_report['fraction'] = df_report['masked'] / n if n else 0.0
+    return df_masks, df_report
+
+
+def scan_masks(scan):
+    """
+    Masked intervals of an item found so far in the format of `load_masks`.
+    """
+    masks = {}
+    for item, _, sensor, check, start, stop, *_ in scan['intervals']:
+        if check != 'gap':
+            masks.setdefault((item, sensor), []).append((start, stop))
+    return {key: tuple(np.array(a, dtype=np.int64) for a in zip(*sorted(iv))) for key, iv in masks.items()}
+
+
+def scan_item(df, item, hist):
+    """
+    Masks and report of an item from all of its rows at once.
+    """
+    scan = new_scan(item, hist, df.columns)
+    update(scan, df)
+    return finish(scan)
+
+
+def load_report(path=report_path):
+    """
+    Quality report of the items that have been checked, empty if the file
+    does not exist.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=['item', 'hist', 'sensor'])
+    return pd.read_csv(path, dtype={'item': str})
+
+
+def save(masks, reports, redone, masks_path=masks_path, report_path=report_path):
+    """
+    Replace the masks and report of the items that were processed again and
+    keep the ones of the other items.
+
+    Parameters
+    ----------
+    masks, reports : list
+        Dataframes of the masks and reports from `finish`.
+    redone : set
+        Tuples of (item, historian) that were processed again.
+    """
+    from process_hydro import atomic
+
+    def merge(old, new, sort):
+        keep = [k not in redone for k in zip(old['item'], old['hist'])]
+        df = pd.concat([old[keep], *new], ignore_index=True)
+        return df.sort_values(sort, kind='stable')
+
+    old = pd.read_csv(masks_path, dtype={'item': str}) if os.path.exists(masks_path) else pd.DataFrame(columns=['item', 'hist'])
+    df_masks = merge(old, masks, ['item', 'hist'])
+    df_report = merge(load_report(report_path), reports, ['item', 'hist'])
+
+    for df, path in ((df_masks, masks_path), (df_report, report_path)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic(path) as tmp:
+            df.to_csv(tmp, index=False)
+    return df_masks, df_report
+
+
+def load_masks(path=masks_path):
+    """
+    Sorted start and stop nanoseconds of the masked intervals for each item
+    and sensor such as ('001', 'PDIT700'). The file is read once and read
+    again only when it changes, and the masks are empty if it does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    mtime = os.stat(path).st_mtime_ns
+    cached = _masks.get(path)
+    if cached is None or cached[0] != mtime:
+        df = pd.read_csv(path, dtype={'item': str}, parse_dates=['start', 'stop'])
+        df = df[df['check'] != 'gap'].sort_values('start')
+        masks = {}
+        for key, d in df.groupby(['item', 'sensor'], sort=False):
+            masks[key] = (d['start'].to_numpy(dtype='datetime64[ns]').view(np.int64), d['stop'].to_numpy(dtype='datetime64[ns]').view(np.int64))
+        cached = _masks[path] = (mtime, masks)
+    return cached[1]
+
+
+def masked(masks, item, sensor, times):
+    """
+    True for the timestamps of an item and sensor inside a masked interval.
+    """
+    ns = np.asarray(times).astype('datetime64[ns]').view(np.int64)
+    if (item, sensor) not in masks:
+        return np.zeros(len(ns), dtype=bool)
+    starts, stops = masks[item, sensor]
+    k = np.searchsorted(starts, ns, side='right') - 1
+    kc = np.maximum(k, 0)
+    return (k >= 0) & (ns <= np.maximum.accumulate(stops)[kc])
+
+
+def apply_masks(df_long, masks=None):
+    """
+    Rows of the long format data with item, sensor, DateTime, and value
+    columns that are not inside a masked interval.
+    """
+    masks = load_masks() if masks is None else masks
+    if not masks or df_long.empty:
+        return df_long
+
+    drop = np.zeros(len(df_long), dtype=bool)
+    t = df_long['DateTime'].to_numpy()
+    for key, rows in df_long.groupby(['item', 'sensor'], sort=False, observed=True).indices.items():
+        if key in masks:
+            drop[rows] = masked(masks, *key, t[rows])
+    return df_long[~drop]
@@ -0,0 +1,117 @@
+"""
+Registry of the hydrodynamics experiments in the R-cubed riser. Each experiment
+is listed by item number in the `experiments.csv` file along with the original
+data file, the time window of the experiment, and the process gas and catalyst
+flows. Programs select items with the functions in this module instead of
+hard-coded tuples of item numbers and flow rates.
+
+Columns
+-------
+item            item number in the experimental matrix spreadsheet
+file            name of the original data files for the day such as rd181210
+date            date of the experiment
+start, stop     time window of the experiment used for the processed data
+gas             process gas group as low, mid, or high
+gasflow         process gas N2 flow from the experimental matrix [SLM]
+cat             catalyst group as none, low, mid, high, or max
+catflow_nom     catalyst flow from the experimental matrix [kg/hr]
+catflow         catalyst flow reported for the experiment [kg/hr]
+replicate       repeat number of the experiment in its gas and catalyst group
+
+Example
+-------
+
+Update the process gas and nominal catalyst flows in `experiments.csv` from the
+experimental matrix spreadsheet. Requires openpyxl to read the spreadsheet.
+
+>>> python registry.py
+"""
+
+import os
+import pandas as pd
+from schema import cat_levels, gas_levels
+
+# loaded registry for each file with the modification time of the file
+_registry = {}
+
+
+def load_experiments(path='experiments.csv'):
+    """
+    Load the registry of experiments as a dataframe indexed by item number.
+    The file is only read again if it has changed. The returned dataframe is
+    shared between calls so it should not be modified.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _registry.get(path)
+    if cached is None or cached[0] != mtime:
+        df = pd.read_csv(path, dtype={'item': str, 'file': str, 'date': str, 'start': str, 'stop': str}, index_col='item')
+        df['gas'] = pd.Categorical(df['gas'], gas_levels, ordered=True)
+        df['cat'] = pd.Categorical(df['cat'], cat_levels, ordered=True)
+        df['replicate'] = df['replicate'].astype('Int64')
+        cached = _registry[path] = (mtime, df)
+    return cached[1]
+
+
+def select(df=None, **criteria):
+    """
+    Experiments that match all the criteria.
+
+    Parameters
+    ----------
+    df : dataframe, optional
+        Registry of experiments, loaded from `experiments.csv` if not given.
+    **criteria
+        Column names and values to match such as gas='low' or cat=['low', 'mid'].
+        Lists, tuples, and sets match any of the values.
+
+    Returns
+    -------
+    df : dataframe
+        Experiments that match the criteria.
+
+    Example
+    -------
+    >>> select(gas='low', cat='none').index
+    Index(['001', '005', '009'], dtype='object', name='item')
+    """
+    if df is None:
+        df = load_experiments()
+    mask = pd.Series(True, index=df.index)
+    for col, value in criteria.items():
+        if isinstance(value, (list, tuple, set)):
+            mask &= df[col].isin(value)
+        else:
+            mask &= df[col] == value
+    return df[mask]
+
+
+def conditions(df=None):
+    """
+    Tuples of (item number, file name, start time, stop time) for each
+    experiment which are used to process the original data.
+    """
+    if df is None:
+        df = load_experiments()
+    return tuple((int(item), r.file, r.start, r.stop) for item, r in zip(df.index, df.itertuples()))
+
+
+def update_from_xlsx(xlsx='spreadsheets/hydro-exp-matrix.xlsx', path='experiments.csv'):
+    """
+    Update the process gas flow and nominal catalyst flow for each item from
+    the experimental matrix spreadsheet. Items in the spreadsheet that are not
+    in the registry are added without a data file or time window.
+    """
+    matrix = pd.read_excel(xlsx, sheet_name='Exp. Matrix', header=20, usecols='A:I').dropna(subset=['Item'])
+    matrix.index = [f'{int(i):03d}' for i in matrix['Item']]
+
+    df = pd.read_csv(path, dtype=str, index_col='item', keep_default_na=False)
+    df = df.reindex(df.index.union(matrix.index), fill_value='')
+    df.index.name = 'item'
+    df.loc[matrix.index, 'gasflow'] = matrix['Process gas N2 (SLM)'].map('{:g}'.format)
+    df.loc[matrix.index, 'catflow_nom'] = matrix['Catalyst flow (kg/hr)'].map('{:g}'.format)
+    df.to_csv(path)
+
+
+if __name__ == '__main__':
+    update_from_xlsx()
+    print(load_experiments())
@@ -0,0 +1,262 @@
+"""
+Render the figures from `dp_cat.py`, `temp_cat.py`, and `p_atm.py` to files
+without an interactive session. Figures are drawn with the Agg backend by a
+pool of worker processes. Each worker loads the data for a historian and
+process gas group once and draws the figures for all the sensors in that
+historian. Long series such as the ~5 Hz h00 data are decimated to the pixel
+width of the axes with a min/max downsample so every peak is still drawn.
+
+Examples
+--------
+
+Figures are written to the `figures-hydro` directory for every PDIT and TE
+sensor and process gas group along with the atmospheric pressure figure. Use
+the format option for SVG or PDF files and the jobs option for the number of
+worker processes. Sensors and gas groups can be given to render a subset.
+
+>>> python render_hydro.py
+>>> python render_hydro.py --format png svg --jobs 4
+>>> python render_hydro.py --gas low --sensors pdit700 te709c
+"""
+
+import os
+import sys
+import time
+import instrument
+from instrument import stage
+from schema import historians
+
+cats = ('none', 'low', 'mid', 'high')
+titles = ('No catalyst', 'Low catalyst flow', 'Mid catalyst flow', 'High catalyst flow')
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def decimate(y, npoints):
+    """
+    Indices and values of a series downsampled to about `npoints` points. The
+    series is split into npoints / 2 bins and the min and max of each bin are
+    kept in their original order so the drawn line has the same envelope as
+    the full series.
+
+    Parameters
+    ----------
+    y : array
+        Values of the series without NaN values.
+    npoints : int
+        Number of points to keep such as twice the pixel width of the axes.
+
+    Returns
+    -------
+    x : array
+        Indices of the kept points in the original series.
+    y : array
+        Values of the kept points.
+    """
+    import numpy as np
+
+    y = np.asarray(y)
+    n = len(y)
+    nbins = max(npoints // 2, 1)
+    if n <= 2 * nbins:
+        return np.arange(n), y
+
+    size = -(-n // nbins)
+    bins = np.pad(y, (0, nbins * size - n), mode='edge').reshape(nbins, size)
+    offset = np.arange(nbins) * size
+    idx = np.concatenate((offset + bins.argmin(axis=1), offset + bins.argmax(axis=1)))
+    idx = np.unique(np.minimum(idx, n - 1))
+    return idx, y[idx]
+
+
+def plot_series(axs, series, ylabel, decimated=False):
+    """
+    Plot the repeated experiments for each catalyst group on a 2x2 grid of
+    axes like the first figure of `dp_cat.py` and `temp_cat.py`.
+
+    Parameters
+    ----------
+    axs : array
+        Axes for the no, low, mid, and high catalyst groups.
+    series : dict
+        Values for each item number in each catalyst group.
+    ylabel : str
+        Label for the y-axis.
+    decimated : bool
+        Decimate each series to twice the pixel width of its axes.
+    """
+    from utils import config_subplot
+
+    for ax, cat, title in zip(axs.flat, cats, titles):
+        for item, y in series[cat].items():
+            if decimated:
+                ax.plot(*decimate(y, 2 * int(ax.bbox.width)), label=item)
+            else:
+                ax.plot(y, label=item)
+        row, col = divmod(cats.index(cat), 2)
+        config_subplot(
+            ax, title, xlabel='Measurement [-]' if row == 1 else '', ylabel=ylabel if col == 0 else ''
+        )
+
+
+def plot_catflow(ax, df_stats, exps, ylabel):
+    """
+    Plot the mean, max, and min of each experiment versus catalyst flow like
+    the second figure of `dp_cat.py` and `temp_cat.py`.
+
+    Parameters
+    ----------
+    ax : axes
+        Axes for the plot.
+    df_stats : dataframe
+        Stats indexed by item number with catflow, mean, max, and min columns.
+    exps : dataframe
+        Experiments from the registry with catflow_nom and replicate columns.
+    ylabel : str
+        Label for the y-axis.
+    """
+    from utils import config
+
+    ax.plot(df_stats['catflow'], df_stats['mean'], 'oC0', label='mean')
+    ax.plot(df_stats['catflow'], df_stats['max'], '.C1', label='max')
+    ax.plot(df_stats['catflow'], df_stats['min'], '.C2', label='min')
+    ax.xaxis.set_ticks(sorted(exps['catflow_nom'].unique()))
+    for _, d in df_stats.groupby(exps['replicate']):
+        ax.fill_between(d['catflow'], d['min'], d['max'], alpha=0.5, facecolor='lightgrey')
+    config(ax, 'Catalyst flow [kg/hr]', ylabel)
+
+
+def plot_patm(ax, ns, patm):
+    """
+    Plot the PIT000 atmospheric pressure for each day like `p_atm.py`. The
+    timestamps and pressures are the sorted arrays from `patm.load_index`.
+    """
+    import numpy as np
+    from utils import config
+
+    days = ns.view('datetime64[ns]').astype('datetime64[D]')
+    for day in np.unique(days):
+        ax.plot(patm[days == day], label=day.astype(object).strftime('%m/%d/%y'))
+    config(ax, 'Measurement [-]', 'Atmospheric pressure [kPa]')
+    ax.legend(loc=2, bbox_to_anchor=(1.05, 1), frameon=False)
+
+
+def ylabel(sensor):
+    """
+    Label for the y-axis of a PDIT or TE sensor.
+    """
+    return 'Differential pressure [kPa]' if sensor.startswith('PDIT') else 'Temperature [K]'
+
+
+def save(fig, path, fmts):
+    """
+    Save a figure in each format and return the paths of the files.
+    """
+    paths = [f'{path}.{fmt}' for fmt in fmts]
+    for p in paths:
+        with stage('savefig'):
+            fig.savefig(p)
+    return paths
+
+
+def render_group(hist, gas, sensors, dst, fmts, dpi):
+    """
+    Render the figures for the sensors of a historian and process gas group.
+    The data for each item is read once for all the sensors.
+
+    Returns
+    -------
+    paths : list
+        Files written for the figures.
+    """
+    import pandas as pd
+    from matplotlib.figure import Figure
+    from registry import select
+    from utils import read_processed, stats_table
+
+    exps = select(gas=gas, cat=cats)
+    data = {item: read_processed(item, hist, sensors) for item in exps.index}
+    paths = []
+
+    for sensor in sensors:
+        series = {cat: {i: data[i][sensor].dropna().to_numpy() for i in select(exps, cat=cat).index} for cat in cats}
+        df_long = pd.concat(
+            [pd.DataFrame({'item': i, 'DateTime': df.index, 'value': df[sensor].to_numpy()}) for i, df in data.items()],
+            ignore_index=True
+        )
+        df_stats = stats_table(df_long)
+        df_stats.insert(2, 'catflow', exps['catflow'])
+
+        with stage('plot'):
+            fig = Figure(figsize=(9.4, 4.8), dpi=dpi, layout='tight')
+            axs = fig.subplots(2, 2, sharex='col')
+            plot_series(axs, series, ylabel(sensor), decimated=True)
+        paths += save(fig, os.path.join(dst, f'{sensor.lower()}_{gas}_series'), fmts)
+
+        with stage('plot'):
+            fig = Figure(dpi=dpi, layout='tight')
+            plot_catflow(fig.subplots(), df_stats, exps, ylabel(sensor))
+        paths += save(fig, os.path.join(dst, f'{sensor.lower()}_{gas}_catflow'), fmts)
+
+    return paths
+
+
+def render_patm(dst, fmts, dpi):
+    """
+    Render the atmospheric pressure figure from `p_atm.py`.
+    """
+    from matplotlib.figure import Figure
+    from patm import load_index
+
+    fig = Figure(dpi=dpi, layout='tight')
+    plot_patm(fig.subplots(), *load_index())
+    return save(fig, os.path.join(dst, 'patm'), fmts)
+
+
+def init_worker():
+    """
+    Use the Agg backend in each worker process.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def run(args):
+    """
+    Render the figures in a pool of worker processes. The arguments are the
+    format, gas, sensors, dpi, jobs, and dst options of the plot subcommand in
+    `riser.py`.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    os.makedirs(args.dst, exist_ok=True)
+    tic = time.perf_counter()
+
+    groups = []
+    for hist, (_, names, _) in historians.items():
+        sensors = [s for s in args.sensors if s in names]
+        groups += [(hist, gas, sensors) for gas in args.gas if sensors]
+
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=init_worker) as pool:
+        futures = {pool.submit(instrument.call, render_group, hist, gas, sensors, args.dst, args.format, args.dpi): (hist, gas)
+                   for hist, gas, sensors in groups}
+        futures[pool.submit(instrument.call, render_patm, args.dst, args.format, args.dpi)] = ('patm', '')
+        nfiles = 0
+        for future in as_completed(futures):
+            hist, gas = futures[future]
+            paths, snap = future.result()
+            instrument.merge(snap)
+            nfiles += len(paths)
+            print(f'Render {hist} {gas} ... {len(paths)} files Complete.')
+
+    print(f'Wrote {nfiles} files to {args.dst} in {time.perf_counter() - tic:.2f} s.')
+
+
+def main():
+    import riser
+    riser.main(['plot', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
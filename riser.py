@@ -0,0 +1,199 @@
+"""
+Command line interface for the R-cubed riser analysis programs. Each
+subcommand runs one of the programs in this directory. Only the standard
+library and `schema.py` are imported until the arguments have been checked, so
+help and argument errors return quickly. Pandas and matplotlib are imported by
+the subcommand that needs them.
+
+Subcommands
+-----------
+ingest      process the original data, same as `process_hydro.py`
+stats       stats for all sensors, same as `stats_hydro.py`
+steady      steady window of each item, same as `steady.py`
+spectral    pressure fluctuation spectra, same as `spectral.py`
+fit         surfaces in gas and catalyst flow, same as `fit_hydro.py`
+watch       keep processed files and stats up to date, same as `watch.py`
+store       memory-mapped store of the processed data, same as `sensor_store.py`
+compact     memory and precision of the compact data, same as `compact.py`
+serve       local HTTP queries of the data and stats, same as `server.py`
+plot        render figures to files, same as `render_hydro.py`
+patm        atmospheric pressure stats and plot, same as `p_atm.py`
+
+Examples
+--------
+>>> python riser.py --help
+>>> python riser.py ingest --jobs 4
+>>> python riser.py stats --split --extra median,p05,p95
+>>> python riser.py stats --steady --window 120
+>>> python riser.py spectral --days rd181212
+>>> python riser.py fit --degree 1 --sensors pdit700 te709c
+>>> python riser.py watch --interval 30
+>>> python riser.py store --float32
+>>> python riser.py stats --compact
+>>> python riser.py serve --port 8765
+>>> python riser.py plot --gas low --sensors pdit700 te709c
+>>> python riser.py patm
+>>> python riser.py ingest --force --profile
+"""
+
+import argparse
+import importlib
+import re
+from schema import gas_levels, pdit_sensors, sensors, te_sensors
+
+# module that runs each subcommand
+commands = {
+    'ingest': 'process_hydro',
+    'stats': 'stats_hydro',
+    'steady': 'steady',
+    'spectral': 'spectral',
+    'fit': 'fit_hydro',
+    'watch': 'watch',
+    'store': 'sensor_store',
+    'compact': 'compact',
+    'serve': 'server',
+    'plot': 'render_hydro',
+    'patm': 'p_atm'
+}
+
+
+def metrics(value):
+    """
+    Tuple of extra stats metrics from a comma separated list such as
+    median,p05,p95,rms.
+    """
+    extra = tuple(e for e in value.lower().split(',') if e)
+    unknown = [e for e in extra if e not in ('median', 'rms') and not re.fullmatch(r'p\d+', e)]
+    if unknown:
+        raise argparse.ArgumentTypeError(f'unknown metric {", ".join(unknown)}')
+    return extra
+
+
+def sensor(value):
+    """
+    Upper case name of a PDIT or TE sensor such as pdit700 or te709c.
+    """
+    name = value.upper()
+    if name not in pdit_sensors + te_sensors:
+        raise argparse.ArgumentTypeError(f'unknown sensor {value}, choose from {", ".join(pdit_sensors + te_sensors)}')
+    return name
+
+
+def any_sensor(value):
+    """
+    Upper case name of any sensor in the historians such as pdit700 or fit600.
+    """
+    name = value.upper()
+    if name not in sensors:
+        raise argparse.ArgumentTypeError(f'unknown sensor {value}, choose from {", ".join(sensors)}')
+    return name
+
+
+def steady_arguments(p):
+    """
+    Add the options for steady state detection to a subcommand parser.
+    """
+    p.add_argument('--window', type=float, default=60.0, help='rolling window for steady state detection [s]')
+    p.add_argument('--drift-tol', type=float, default=2.0, help='largest drift over a window as a multiple of the noise')
+    p.add_argument('--std-tol', type=float, default=2.0, help='largest std of a window as a multiple of the noise')
+    p.add_argument('--min-length', type=float, default=120.0, help='shortest steady window [s]')
+    p.add_argument('--steady-sensors', nargs='+', type=sensor, default=['PDIT700', 'PDIT704'], help='sensors used to detect steady state')
+
+
+def profile_arguments(p):
+    """
+    Add the profiling options to a subcommand parser.
+    """
+    p.add_argument('--profile', action='store_true', help='print the time in each stage and the rows of each file')
+    p.add_argument('--profile-out', default=None, metavar='PREFIX', help='also write cProfile and trace files with this prefix')
+
+
+def parser():
+    """
+    Argument parser for the riser command and its subcommands.
+    """
+    p = argparse.ArgumentParser(prog='riser', description='Analysis of the R-cubed riser hydrodynamics data.')
+    sub = p.add_subparsers(dest='command', required=True, metavar='command')
+
+    ingest = sub.add_parser('ingest', help='process the original data files')
+    ingest.add_argument('--jobs', type=int, default=None, help='number of worker processes, default is number of CPUs')
+    ingest.add_argument('--force', action='store_true', help='process all files and ignore the manifest')
+    ingest.add_argument('--chunksize', type=int, default=None, help='stream original files in chunks of this many rows')
+    ingest.add_argument('--writers', type=int, default=2, help='writer threads for each worker, 0 writes on the worker thread')
+    ingest.add_argument('--check', action='store_true', help='compare in-memory and streamed ingest without writing, chunk size default 10000')
+
+    stats = sub.add_parser('stats', help='stats for all sensors and experiments')
+    stats.add_argument('--split', action='store_true', help='write a stats file for each PDIT and TE sensor')
+    stats.add_argument('--plot', action='store_true', help='plot stats for each PDIT and TE sensor')
+    stats.add_argument('--extra', type=metrics, default=(), help='extra metrics as median, rms, p05, p95 etc.')
+    stats.add_argument('--steady', action='store_true', help='stats over the steady window of each item')
+    stats.add_argument('--mask', action='store_true', help='leave out the rows flagged by the quality checks')
+    stats.add_argument('--compact', action='store_true', help='load categorical keys, int64 timestamps, and float32 values')
+    steady_arguments(stats)
+
+    steady = sub.add_parser('steady', help='detect the steady window of each item')
+    steady_arguments(steady)
+
+    spectral = sub.add_parser('spectral', help='spectra and autocorrelation of the h00 pressures')
+    spectral.add_argument('--nperseg', type=int, default=256, help='number of samples in each Welch segment')
+    spectral.add_argument('--maxlag', type=float, default=60.0, help='largest lag of the autocorrelation [s]')
+    spectral.add_argument('--days', nargs='+', default=None, help='full-day files such as rd181212 instead of items')
+    spectral.add_argument('--force', action='store_true', help='compute all spectra and ignore the cache')
+
+    fit = sub.add_parser('fit', help='fit sensor stats as surfaces in gas and catalyst flow')
+    fit.add_argument('--degree', type=int, default=2, choices=[1, 2, 3], help='total degree of the polynomial surface')
+    fit.add_argument('--metric', default='mean', choices=['mean', 'std', 'max', 'min'], help='stats column to fit')
+    fit.add_argument('--level', type=float, default=0.95, help='confidence level of the intervals')
+    fit.add_argument('--sensors', nargs='+', type=any_sensor, default=None, help='sensors to fit, default is all')
+    fit.add_argument('--recompute', action='store_true', help='compute the stats again instead of reading stats_all.csv')
+
+    watch = sub.add_parser('watch', help='update processed files and stats as original files grow')
+    watch.add_argument('--interval', type=float, default=5.0, help='time between polls of original-hydro [s]')
+    watch.add_argument('--once', action='store_true', help='poll one time and exit')
+    watch.add_argument('--reset', action='store_true', help='discard the saved state and parse all files from the start')
+    watch.add_argument('--split', action='store_true', help='also write a stats file for each PDIT and TE sensor')
+    watch.add_argument('--mask', action='store_true', help='leave out the rows flagged by the quality checks')
+
+    store = sub.add_parser('store', help='build the memory-mapped store of the processed data')
+    store.add_argument('--float32', action='store_true', help='store sensor values as float32')
+
+    compact = sub.add_parser('compact', help='memory of each item and precision of the compact data')
+    compact.add_argument('--mask', action='store_true', help='leave out the rows flagged by the quality checks')
+
+    serve = sub.add_parser('serve', help='serve queries of the data and stats over local HTTP')
+    serve.add_argument('--host', default='127.0.0.1', help='address to listen on, 0.0.0.0 for other nodes')
+    serve.add_argument('--port', type=int, default=8765, help='port to listen on, 0 for a free port')
+    serve.add_argument('--mask', action='store_true', help='leave out the rows flagged by the quality checks')
+    serve.add_argument('--compact', action='store_true', help='load float32 values where the precision allows')
+    serve.add_argument('--verbose', action='store_true', help='log each request')
+
+    plot = sub.add_parser('plot', help='render figures to files without a display')
+    plot.add_argument('--format', nargs='+', default=['png'], choices=['png', 'svg', 'pdf'], help='file formats')
+    plot.add_argument('--gas', nargs='+', default=list(gas_levels), choices=gas_levels, help='process gas groups')
+    plot.add_argument('--sensors', nargs='+', type=sensor, default=pdit_sensors + te_sensors, help='sensors such as pdit700 or te709c')
+    plot.add_argument('--dpi', type=int, default=100, help='resolution of the figures')
+    plot.add_argument('--jobs', type=int, default=None, help='number of worker processes, default is number of CPUs')
+    plot.add_argument('--dst', default='figures-hydro', help='directory for the figure files')
+
+    patm = sub.add_parser('patm', help='atmospheric pressure stats and plot')
+    patm.add_argument('--tolerance', type=float, default=120.0, help='largest age of the PIT000 reading joined onto a sample [s]')
+
+    for p_sub in sub.choices.values():
+        profile_arguments(p_sub)
+    return p
+
+
+def main(argv=None):
+    """
+    Check the arguments then import and run the module for the subcommand.
+    The run is profiled with the profile options or the `RISER_PROFILE`
+    environment variable, see `instrument.py`.
+    """
+    args = parser().parse_args(argv)
+    from instrument import session
+    with session(args.profile, args.profile_out):
+        importlib.import_module(commands[args.command]).run(args)
+
+
+if __name__ == '__main__':
+    main()
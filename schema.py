@@ -0,0 +1,50 @@
+"""
+Schema of the hydrodynamics data. The historian columns, sample cadence,
+sensor names, and experiment groups are plain Python constants so command line
+programs can check their arguments without importing pandas or reading any
+data files.
+"""
+
+# Column numbers, column names, and datetime format for each historian file.
+# The h00 file is the ~5 Hz differential pressure data, the h0m file is the
+# flow and pressure data about every 4 s, and the h19 file is the
+# thermocouple data every minute, see `cadence` below.
+historians = {
+    'h00': (
+        [0, 6, 7, 8],
+        ['DateTime', 'PDIT705', 'PDIT706', 'PDIT707'],
+        '%m/%d/%Y %H:%M:%S.%f'
+    ),
+    'h0m': (
+        [0] + list(range(13, 23)),
+        ['DateTime', 'FIT600', 'FT702', 'FT750', 'PIT700', 'PIT780', 'PDIT700', 'PDIT704', 'PDIT780', 'ZC742', 'ZC762'],
+        '%m/%d/%Y %H:%M:%S'
+    ),
+    'h19': (
+        [0] + list(range(3, 26)),
+        ['DateTime', 'TE629', 'TE701', 'TE705', 'TE706A_1', 'TE706A_2', 'TE706B_1', 'TE706B_2', 'TE706C_1', 'TE706C_2', 'TE707A', 'TE707B', 'TE707C', 'TE708A_1', 'TE708A_2', 'TE708B_1', 'TE708B_2', 'TE708C_1', 'TE708C_2', 'TE709A', 'TE709B', 'TE709C', 'TE741A', 'TE743'],
+        '%m/%d/%y %H:%M'
+    )
+}
+
+# Column numbers of the raw values for historians with a "Base Avg" row. The
+# columns in `historians` for these files are the baseline subtracted values
+# from the spreadsheet, which are used to find the exact baseline.
+raw_columns = {
+    'h00': [3, 4, 5],
+    'h0m': list(range(3, 13))
+}
+
+# Nominal time between samples in seconds for each historian
+cadence = {'h00': 0.2, 'h0m': 4.0, 'h19': 60.0}
+
+# Historian name for each sensor
+sensors = {name: hist for hist, (_, names, _) in historians.items() for name in names[1:]}
+
+# Differential pressure and thermocouple sensors along the riser
+pdit_sensors = ['PDIT700', 'PDIT704', 'PDIT705', 'PDIT706', 'PDIT707']
+te_sensors = ['TE709C', 'TE709B', 'TE709A', 'TE707C', 'TE707B', 'TE707A', 'TE705', 'TE701']
+
+# Process gas and catalyst groups of the experiments
+gas_levels = ('low', 'mid', 'high')
+cat_levels = ('none', 'low', 'mid', 'high', 'max')
@@ -0,0 +1,201 @@
+"""
+Memory-mapped store of the processed sensor data for repeated analysis. Each
+sensor is one contiguous binary array of values for all the items and each
+historian has one array of int64 nanosecond timestamps. An index gives the
+offset and length of every item in the arrays of its historian so a slice for
+one item is read with `np.memmap` without parsing any files.
+
+Layout
+------
+cache-hydro/mmap/index.json     offsets, lengths, t0, and dt for each item
+cache-hydro/mmap/h00.time       timestamps for the h00 historian
+cache-hydro/mmap/PDIT705.bin    values for the PDIT705 sensor
+
+Examples
+--------
+
+Build the store from the processed data. Values are float64 unless the float32
+option is given. The data type is kept in the index and a float32 store is only
+read by the compact loaders, see `compact.py`. The other loaders warn and read
+float64 values from the columnar store or the processed files instead, so the
+stats do not change with the store. Run this again after `process_hydro.py` has
+updated the processed data.
+
+>>> python sensor_store.py
+>>> python sensor_store.py --float32
+"""
+
+import glob
+import json
+import os
+import sys
+import warnings
+
+store_dir = os.path.join('cache-hydro', 'mmap')
+
+# loaded index for each store directory with the modification time of the file
+_indexes = {}
+
+# store directories and data types that have been warned about
+_warned = set()
+
+
+def processed_items(src='processed-hydro'):
+    """
+    Sorted item numbers of the processed data files.
+    """
+    return sorted({os.path.basename(f).split('_')[0] for f in glob.glob(os.path.join(src, '*.csv'))})
+
+
+def build_store(items, dtype='float64', store=store_dir):
+    """
+    Write the processed data for the items to the memory-mapped store. One
+    item is loaded at a time so memory use does not depend on the number of
+    items.
+
+    Parameters
+    ----------
+    items : list
+        Item numbers such as 001 and 101.
+    dtype : str
+        Data type for the sensor values as float64 or float32.
+    store : str
+        Directory of the memory-mapped store.
+    """
+    import numpy as np
+    from schema import historians
+    from utils import read_processed
+
+    os.makedirs(store, exist_ok=True)
+    index = {'dtype': dtype, 'sensors': {}, 'items': {}}
+
+    # remove the index first so readers do not use a partly written store
+    if os.path.exists(os.path.join(store, 'index.json')):
+        os.remove(os.path.join(store, 'index.json'))
+
+    for hist, (_, names, _) in historians.items():
+        sensors = names[1:]
+        index['sensors'][hist] = sensors
+        files = {s: open(os.path.join(store, f'{s}.bin'), 'wb') for s in sensors}
+        offset = 0
+
+        with open(os.path.join(store, f'{hist}.time'), 'wb') as ft:
+            for item in items:
+                df = read_processed(item, hist, sensors)
+                ns = df.index.as_unit('ns').asi8
+                ns.tofile(ft)
+                for s in sensors:
+                    df[s].to_numpy(dtype=dtype).tofile(files[s])
+                dt = float(np.median(np.diff(ns))) / 1e9 if len(ns) > 1 else 0.0
+                t0 = int(ns[0]) if len(ns) else 0
+                index['items'][f'{item}/{hist}'] = [offset, len(ns), t0, dt]
+                offset += len(ns)
+
+        for f in files.values():
+            f.close()
+
+    with open(os.path.join(store, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+
+
+def remove_index(store=store_dir):
+    """
+    Remove the index of the store so it is not used until it is built again.
+    """
+    path = os.path.join(store, 'index.json')
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_index(store=store_dir):
+    """
+    Load the index of the store. The index is loaded again only if the file has
+    changed. None is returned if the store has not been built.
+    """
+    path = os.path.join(store, 'index.json')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _indexes.get(store)
+    if cached is None or cached[0] != mtime:
+        with open(path) as f:
+            cached = _indexes[store] = (mtime, json.load(f))
+    return cached[1]
+
+
+def read_slice(item, hist, sensors, store=store_dir, dtypes=('float64',)):
+    """
+    Memory-mapped arrays of the timestamps and sensor values for an item. A
+    store with values of another data type than `dtypes` is not read, with a
+    warning the first time.
+
+    Parameters
+    ----------
+    item : str
+        Item number such as 001 or 101.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    sensors : list
+        Column names such as PDIT700 or TE709C.
+    store : str
+        Directory of the memory-mapped store.
+    dtypes : tuple
+        Data types of the values the caller accepts such as float64 and
+        float32.
+
+    Returns
+    -------
+    time : memmap or None
+        Timestamps as datetime64[ns] values. None if the item or a sensor is
+        not in the store, or the values are not of one of the `dtypes`.
+    values : dict
+        Memory-mapped values for each sensor.
+    """
+    import numpy as np
+
+    index = load_index(store)
+    key = f'{item}/{hist}'
+    if index is None or key not in index['items'] or not set(sensors) <= set(index['sensors'][hist]):
+        return None, {}
+    if index['dtype'] not in dtypes:
+        if (store, dtypes) not in _warned:
+            _warned.add((store, dtypes))
+            warnings.warn(
+                f'Memory-mapped store has {index["dtype"]} values, reading {" or ".join(dtypes)} values from the '
+                'processed data instead. Build the store again without --float32 or use the compact option.',
+                stacklevel=2
+            )
+        return None, {}
+
+    offset, length, _, _ = index['items'][key]
+    if length == 0:
+        return np.empty(0, 'datetime64[ns]'), {s: np.empty(0, index['dtype']) for s in sensors}
+
+    time = np.memmap(os.path.join(store, f'{hist}.time'), dtype='datetime64[ns]', mode='r', offset=offset * 8, shape=(length,))
+    size = np.dtype(index['dtype']).itemsize
+    values = {
+        s: np.memmap(os.path.join(store, f'{s}.bin'), dtype=index['dtype'], mode='r', offset=offset * size, shape=(length,))
+        for s in sensors
+    }
+    return time, values
+
+
+def run(args):
+    """
+    Build the store for all the processed items. The argument is the float32
+    option of the store subcommand in `riser.py`.
+    """
+    items = processed_items()
+    print(f'Build memory-mapped store for {len(items)} items ... ', end='')
+    build_store(items, dtype='float32' if args.float32 else 'float64')
+    print('Complete.')
+
+
+def main():
+    import riser
+    riser.main(['store', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""
+Local HTTP server for queries of the processed riser data and stats. The data
+of every sensor and processed item is loaded once into memory as int64
+timestamps and float64 values, so clients on the other nodes share one parsed
+copy instead of each reading the processed files. With the compact option the
+values are float32 where the precision allows, as in `compact.py`, which takes
+three quarters of the memory but gives stats of the float32 rounded values.
+Requests are handled on threads and the computed results are kept in an
+LRU cache keyed by the query, so a repeated query is answered without
+computing it again. Restart the server to load the data again after
+`process_hydro.py` or `watch.py` have updated the processed files.
+
+Queries
+-------
+/items      experiments of the registry
+/sensors    historian of each sensor
+/data       values of a sensor for the items between t0 and t1, resampled to
+            a frequency such as 10s with the agg option as mean, min, max,
+            std, median, first, last, or count
+/stats      stats of a sensor by item or by gas, cat, and replicate groups
+            with extra metrics such as median, p05, p95, or rms
+/cache      hits, misses, and size of the LRU cache
+
+The items option is a comma separated list and all the items are used if it
+is not given. The t0 and t1 options are times such as 2018-12-11T10:30. Data
+and stats are returned as JSON in the split layout of pandas with a columns and
+a data list, or as an Arrow IPC stream with format=arrow when pyarrow is
+installed. Errors are returned as JSON with an error message.
+
+Examples
+--------
+
+Serve on localhost port 8765 until stopped with Ctrl+C. Use the host option
+to accept queries from other nodes.
+
+>>> python server.py
+>>> python server.py --host 0.0.0.0 --port 8000
+>>> python server.py --compact
+
+>>> curl 'http://127.0.0.1:8765/data?sensor=pdit700&items=001,002&resample=10s'
+>>> curl 'http://127.0.0.1:8765/stats?sensor=te709c&by=gas,cat&extra=median'
+
+The server can also be started on a free port from Python such as for tests.
+
+>>> from server import load_data, start
+>>> load_data(['001', '002'])
+>>> srv = start(port=0)
+>>> url = f'http://127.0.0.1:{srv.server_port}/stats?sensor=pdit700'
+>>> srv.shutdown()
+"""
+
+import functools
+import io
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from schema import sensors
+
+# timestamps and values of each sensor and item loaded by `load_data`
+_data = {}
+
+# number of query results kept in the LRU cache
+cache_size = 256
+
+# lock of each query that is being computed so concurrent requests for the
+# same query wait for the one result instead of computing it again
+_pending = {}
+_guard = threading.Lock()
+
+aggs = ('mean', 'min', 'max', 'std', 'median', 'first', 'last', 'count')
+groups = ('item', 'gas', 'cat', 'replicate')
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def load_data(items=None, mask=False, compact=False):
+    """
+    Load the data of every sensor for the items, or all the processed items
+    if not given, as int64 timestamps and float64 values, or float32 values
+    where the precision allows if `compact` is True. Rows flagged by the
+    quality checks are dropped if `mask` is True. The cached arrays of the
+    loader are released so only the loaded copy stays in memory.
+
+    Returns
+    -------
+    nbytes : int
+        Memory of the loaded arrays.
+    """
+    import numpy as np
+    from sensor_store import processed_items
+    from utils import item_arrays, load_items
+
+    items = processed_items() if items is None else list(items)
+    data = {}
+    for name in sensors:
+        data[name] = load_items(name, items, arrays=True, mask=mask, compact=compact)
+        if not compact:
+            data[name] = {item: (t.view(np.int64), y) for item, (t, y) in data[name].items()}
+        item_arrays.cache_clear()
+
+    _data.clear()
+    _data.update(data)
+    series.cache_clear()
+    group_stats.cache_clear()
+    return sum(t.nbytes + y.nbytes for d in data.values() for t, y in d.values())
+
+
+def sensor_name(value):
+    """
+    Upper case name of a sensor such as pdit700 that has been loaded.
+    """
+    name = (value or '').upper()
+    if name not in _data:
+        raise ValueError(f'Unknown sensor {value}, choose from {", ".join(_data)}.')
+    return name
+
+
+def item_list(value, sensor):
+    """
+    Tuple of item numbers from a comma separated list, all the loaded items
+    of the sensor if the list is not given.
+    """
+    if not value:
+        return tuple(_data[sensor])
+    items = tuple(v.strip() for v in value.split(',') if v.strip())
+    unknown = [v for v in items if v not in _data[sensor]]
+    if unknown:
+        raise ValueError(f'Unknown item {", ".join(unknown)}.')
+    return items
+
+
+def nanoseconds(value):
+    """
+    Int64 nanoseconds of a time such as 2018-12-11T10:30, None if not given.
+    """
+    import pandas as pd
+
+    return pd.Timestamp(value).as_unit('ns').value if value else None
+
+
+def frequency(value):
+    """
+    Normalized frequency string such as 10s, None if not given.
+    """
+    import pandas as pd
+
+    return pd.tseries.frequencies.to_offset(value).freqstr if value else None
+
+
+@functools.lru_cache(maxsize=cache_size)
+def series(sensor, items, t0=None, t1=None, resample=None, agg='mean'):
+    """
+    Long format data of a sensor for the items with item, DateTime, and value
+    columns, between t0 and t1 nanoseconds and resampled to a frequency with
+    an aggregation if given. The frame is shared by the cache so it should
+    not be modified.
+    """
+    import numpy as np
+    import pandas as pd
+
+    data = {}
+    for item in items:
+        ns, y = _data[sensor][item]
+        ok = np.ones(len(ns), dtype=bool)
+        if t0 is not None:
+            ok &= ns >= t0
+        if t1 is not None:
+            ok &= ns <= t1
+        ns, y = ns[ok], y[ok]
+        if resample:
+            s = pd.Series(y, index=pd.DatetimeIndex(ns.view('datetime64[ns]'))).resample(resample).agg(agg).dropna()
+            ns, y = s.index.as_unit('ns').asi8, s.to_numpy()
+        data[item] = (ns, y)
+
+    lengths = [len(ns) for ns, _ in data.values()]
+    return pd.DataFrame({
+        'item': pd.Categorical.from_codes(np.repeat(np.arange(len(data)), lengths), categories=list(data)),
+        'DateTime': np.concatenate([ns for ns, _ in data.values()] or [np.empty(0, np.int64)]).view('datetime64[ns]'),
+        'value': np.concatenate([y for _, y in data.values()] or [np.empty(0)])
+    })
+
+
+@functools.lru_cache(maxsize=cache_size)
+def group_stats(sensor, items, t0=None, t1=None, by=('item',), extra=()):
+    """
+    Stats of a sensor for the items between t0 and t1 nanoseconds. By item
+    the rows are the same as the stats of `stats_hydro.py` with the same
+    compact option, otherwise the samples of all the items in each group of
+    the registry are pooled and the number of items replaces the start and
+    stop.
+    """
+    from stats_hydro import arrange, experiments
+    from utils import stats_table
+
+    df_exp = experiments()
+    df = series(sensor, items, t0, t1).assign(sensor=sensor)
+
+    if by == ('item',):
+        df = stats_table(df, by=['sensor', 'item'], extra=extra).reset_index()
+        return arrange(df, df_exp, extra).reset_index(drop=True)
+
+    # start and stop of pooled items from different days are replaced by
+    # the number of items in the group
+    cols = [c for c in by if c != 'item']
+    df = df.assign(item=df['item'].astype(str)).merge(df_exp[['item', *cols]], on='item')
+    n = df.groupby(list(by), observed=True)['item'].nunique().rename('items')
+    df = stats_table(df, by=['sensor', *by], extra=extra).drop(columns=['start', 'stop'])
+    df = df.reset_index().join(n, on=list(by))
+    df = df[['sensor', *by, 'items', *df.columns[len(by) + 1:-1]]]
+    return df.sort_values(list(by), kind='stable').reset_index(drop=True)
+
+
+def shared(fn, *args):
+    """
+    Call a cached query function with only one thread computing each result
+    that is not in the cache.
+    """
+    key = (fn.__name__, args)
+    with _guard:
+        lock = _pending.setdefault(key, threading.Lock())
+    with lock:
+        result = fn(*args)
+    with _guard:
+        _pending.pop(key, None)
+    return result
+
+
+def query(path, params):
+    """
+    Result of a query path such as /data with the options of the query.
+
+    Returns
+    -------
+    result : dataframe or dict
+        Dataframe for the items, data, and stats queries, dict for the
+        others, and None if the path is not a query.
+    """
+    def options(*names):
+        unknown = set(params) - set(names)
+        if unknown:
+            raise ValueError(f'Unknown option {", ".join(sorted(unknown))} for {path}.')
+        return params.get
+
+    if path == '/items':
+        options()
+        from stats_hydro import experiments
+        return experiments()
+    if path == '/sensors':
+        options()
+        return {name: hist for name, hist in sensors.items() if name in _data}
+    if path == '/cache':
+        options()
+        return {f.__name__: f.cache_info()._asdict() for f in (series, group_stats)}
+
+    if path == '/data':
+        get = options('sensor', 'items', 't0', 't1', 'resample', 'agg')
+        sensor = sensor_name(get('sensor'))
+        agg = get('agg') or 'mean'
+        if agg not in aggs:
+            raise ValueError(f'Unknown agg {agg}, choose from {", ".join(aggs)}.')
+        return shared(series, sensor, item_list(get('items'), sensor), nanoseconds(get('t0')), nanoseconds(get('t1')), frequency(get('resample')), agg)
+
+    if path == '/stats':
+        get = options('sensor', 'items', 't0', 't1', 'by', 'extra')
+        sensor = sensor_name(get('sensor'))
+        by = tuple(b for b in (get('by') or 'item').lower().split(',') if b)
+        if not by or not set(by) <= set(groups):
+            raise ValueError(f'Unknown group {get("by")}, choose from {", ".join(groups)}.')
+        extra = tuple(e for e in (get('extra') or '').lower().split(',') if e)
+        return shared(group_stats, sensor, item_list(get('items'), sensor), nanoseconds(get('t0')), nanoseconds(get('t1')), by, extra)
+
+    return None
+
+
+def encode(result, fmt='json'):
+    """
+    Body and content type of a query result as JSON or an Arrow IPC stream.
+    """
+    import pandas as pd
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        pa = None
+
+    if fmt == 'arrow':
+        if pa is None:
+            raise ValueError('Arrow format requires pyarrow.')
+        if not isinstance(result, pd.DataFrame):
+            raise ValueError('Arrow format is only for the items, data, and stats queries.')
+        table = pa.Table.from_pandas(result, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue(), 'application/vnd.apache.arrow.stream'
+
+    if fmt != 'json':
+        raise ValueError(f'Unknown format {fmt}, use json or arrow.')
+    if isinstance(result, pd.DataFrame):
+        body = result.to_json(orient='split', index=False, date_format='iso', date_unit='ms', double_precision=15)
+    else:
+        body = json.dumps(result)
+    return body.encode(), 'application/json'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answer GET requests with the result of `query`.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        fmt = params.pop('format', 'json')
+        status = 200
+        try:
+            result = query(url.path, params)
+            if result is None:
+                status, error = 404, f'Unknown query {url.path}.'
+            else:
+                body, ctype = encode(result, fmt)
+        except ValueError as e:
+            status, error = 400, str(e)
+        except Exception as e:
+            # the error is returned so the client does not see a dropped
+            # connection and the server keeps running
+            status, error = 500, f'{type(e).__name__}: {e}'
+        if status != 200:
+            body, ctype = json.dumps({'error': error}).encode(), 'application/json'
+
+        self.send_response(status)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host='127.0.0.1', port=8765, verbose=False):
+    """
+    Server that handles each request on a thread. Each request is logged to
+    stderr if `verbose` is True.
+    """
+    srv = ThreadingHTTPServer((host, port), Handler)
+    srv.daemon_threads = True
+    srv.verbose = verbose
+    return srv
+
+
+def start(host='127.0.0.1', port=8765, verbose=False):
+    """
+    Start the server on a background thread and return it. Port 0 uses a
+    free port, which is given by `server_port`. Stop it with `shutdown`.
+    """
+    srv = make_server(host, port, verbose)
+    threading.Thread(target=srv.serve_forever, name='server', daemon=True).start()
+    return srv
+
+
+def run(args):
+    """
+    Load the data and serve queries until stopped. The arguments are the
+    host, port, mask, compact, and verbose options of the serve subcommand in
+    `riser.py`.
+    """
+    import time
+
+    print('Load processed data ... ', end='', flush=True)
+    tic = time.perf_counter()
+    nbytes = load_data(mask=args.mask, compact=args.compact)
+    toc = time.perf_counter()
+    print(f'{len(_data)} sensors in {nbytes / 2 ** 20:.1f} MiB in {toc - tic:.1f} s. Complete.')
+
+    srv = make_server(args.host, args.port, args.verbose)
+    print(f'Serve on http://{args.host}:{srv.server_port}, stop with Ctrl+C.')
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        print('Stop serving.')
+    finally:
+        srv.server_close()
+
+
+def main():
+    import riser
+    riser.main(['serve', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+Spectral and fluctuation analysis of the ~5 Hz differential pressure data from
+the h00 historian. The PDIT705, PDIT706, and PDIT707 signals are resampled to a
+uniform time step, then the Welch power spectral density and autocorrelation
+are computed for all items and sensors together. Welch segments of every
+series are stacked into one 2-D array for a single FFT, and the
+autocorrelations are computed as one batch of zero padded FFTs. Segments that
+span a gap in the data are left out of the spectra.
+
+The spectra for each item are cached in `cache-hydro/spectral` and are only
+computed again when the processed file or the analysis options change. The
+dominant frequency, power in frequency bands, fluctuation intensity, and
+autocorrelation time scales are written to `results-hydro/spectral.csv`.
+
+Examples
+--------
+
+Analyze all the items. Use the nperseg option for the number of samples in each
+Welch segment and the force option to ignore the cache.
+
+>>> python spectral.py
+>>> python spectral.py --nperseg 512 --force
+
+Analyze full-day original h00 files instead of the item windows. Results are
+written to `results-hydro/spectral_days.csv`.
+
+>>> python spectral.py --days rd181212 rd181214
+"""
+
+import os
+import sys
+from instrument import stage
+from schema import historians
+
+sensors = historians['h00'][1][1:]
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def resample(ns, y, dt=0.2, max_gap=1.0):
+    """
+    Linear interpolation of a series onto a uniform time step.
+
+    Parameters
+    ----------
+    ns : array
+        Timestamps as int64 nanoseconds.
+    y : array
+        Values of the series.
+    dt : float
+        Time step of the resampled series in seconds.
+    max_gap : float
+        Samples are not valid where the original data has a gap longer than
+        this many seconds.
+
+    Returns
+    -------
+    yu : array
+        Resampled values.
+    valid : array
+        False where the resampled value falls in a gap of the original data.
+    """
+    import numpy as np
+
+    ok = ~np.isnan(y)
+    t = (ns[ok] - ns[0]) / 1e9
+    y = y[ok]
+    if len(t) < 2:
+        return np.empty(0), np.empty(0, bool)
+    tu = np.arange(0, t[-1], dt)
+    yu = np.interp(tu, t, y)
+    gap = np.diff(t) > max_gap
+    valid = ~gap[np.clip(np.searchsorted(t, tu, side='right') - 1, 0, len(gap) - 1)]
+    return yu, valid
+
+
+def welch(series, dt=0.2, nperseg=256, overlap=0.5):
+    """
+    Welch power spectral density of a batch of series. Segments of all the
+    series are stacked into one 2-D array, detrended by their mean, tapered
+    with a Hann window, and transformed with one FFT. The spectra of the
+    segments are averaged for each series.
+
+    Parameters
+    ----------
+    series : list
+        Tuples of (values, valid) from `resample`.
+    dt : float
+        Time step of the series in seconds.
+    nperseg : int
+        Number of samples in each segment.
+    overlap : float
+        Fraction of overlap between segments.
+
+    Returns
+    -------
+    freq : array
+        Frequencies in Hz.
+    psd : array
+        One-sided power spectral density for each series, NaN if a series has
+        no segment without gaps.
+    nseg : array
+        Number of segments averaged for each series.
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    step = max(nperseg - int(nperseg * overlap), 1)
+    segs = []
+    owners = []
+    for k, (y, valid) in enumerate(series):
+        if len(y) < nperseg:
+            continue
+        s = sliding_window_view(y, nperseg)[::step]
+        ok = sliding_window_view(valid, nperseg)[::step].all(axis=1)
+        segs.append(s[ok])
+        owners.append(np.full(ok.sum(), k))
+
+    nfreq = nperseg // 2 + 1
+    freq = np.fft.rfftfreq(nperseg, dt)
+    nseg = np.zeros(len(series), int)
+    psd = np.full((len(series), nfreq), np.nan)
+    if not segs:
+        return freq, psd, nseg
+
+    x = np.concatenate(segs)
+    owner = np.concatenate(owners)
+    x = x - x.mean(axis=1, keepdims=True)
+    win = np.hanning(nperseg)
+    p = np.abs(np.fft.rfft(x * win, axis=1)) ** 2
+
+    # one-sided density so the sum of psd * df is the variance
+    p *= dt / (win ** 2).sum()
+    p[:, 1:nfreq - (nperseg % 2 == 0)] *= 2
+
+    nseg = np.bincount(owner, minlength=len(series))
+    has = nseg > 0
+    psd[has] = np.add.reduceat(p, np.flatnonzero(np.diff(np.r_[-1, owner])))
+    psd[has] /= nseg[has, None]
+    return freq, psd, nseg
+
+
+def autocorr(series, maxlag):
+    """
+    Autocorrelation of a batch of series up to `maxlag` samples. The series are
+    zero padded into one 2-D array and correlated with FFTs. Each lag is
+    normalized by the number of valid pairs of samples so gaps and the padding
+    do not bias the result.
+
+    Parameters
+    ----------
+    series : list
+        Tuples of (values, valid) from `resample`.
+    maxlag : int
+        Largest lag in samples.
+
+    Returns
+    -------
+    acf : array
+        Autocorrelation for each series at lags 0 to maxlag.
+    """
+    import numpy as np
+
+    n = max((len(y) for y, _ in series), default=0)
+    nfft = 1 << int(2 * max(n, maxlag + 1) - 1).bit_length()
+    x = np.zeros((len(series), n))
+    m = np.zeros((len(series), n))
+    for k, (y, valid) in enumerate(series):
+        if valid.any():
+            x[k, :len(y)] = np.where(valid, y - y[valid].mean(), 0)
+            m[k, :len(y)] = valid
+
+    def correlate(a):
+        f = np.fft.rfft(a, nfft, axis=1)
+        return np.fft.irfft(f * f.conj(), nfft, axis=1)[:, :maxlag + 1]
+
+    pairs = np.round(correlate(m))
+    acf = np.divide(correlate(x), pairs, out=np.full(pairs.shape, np.nan), where=pairs > 0)
+    return acf / acf[:, :1]
+
+
+def timescales(acf, dt):
+    """
+    Integral time scale to the first zero crossing and the decorrelation time
+    where the autocorrelation first drops below 1/e, both in seconds.
+    """
+    import numpy as np
+
+    below = acf <= 0
+    first_zero = np.where(below.any(axis=1), below.argmax(axis=1), acf.shape[1])
+    lags = np.arange(acf.shape[1])
+    t_int = np.where(lags < first_zero[:, None], np.nan_to_num(acf), 0).sum(axis=1) * dt
+    decay = acf < np.exp(-1)
+    t_decorr = np.where(decay.any(axis=1), decay.argmax(axis=1) * dt, np.nan)
+    return t_int, t_decorr
+
+
+def stamp(path):
+    """
+    Size and modification time of a file used to check the cache.
+    """
+    st = os.stat(path)
+    return f'{st.st_size}-{st.st_mtime_ns}'
+
+
+def analyze(frames, dt=0.2, nperseg=256, maxlag=60.0, cache='cache-hydro/spectral', force=False):
+    """
+    Spectra and autocorrelations for each named dataframe of h00 sensors.
+    Cached results are used where the key of the source data and options has
+    not changed and the rest are computed together as one batch.
+
+    Parameters
+    ----------
+    frames : dict
+        Tuples of (loader, key) for each item or day name. The loader returns
+        a dataframe of the sensors indexed by datetime.
+    dt : float
+        Time step of the resampled series in seconds.
+    nperseg : int
+        Number of samples in each Welch segment.
+    maxlag : float
+        Largest lag of the autocorrelation in seconds.
+    cache : str
+        Directory of the cached results.
+    force : bool
+        Compute all the results and ignore the cache.
+
+    Returns
+    -------
+    results : dict
+        Arrays of freq, psd, nseg, acf, mean, and std for each name where psd
+        and acf have a row for each sensor.
+    """
+    import numpy as np
+
+    os.makedirs(cache, exist_ok=True)
+    options = f'{dt}-{nperseg}-{maxlag}-{"-".join(sensors)}'
+    results = {}
+    todo = []
+
+    for name, (loader, key) in frames.items():
+        path = os.path.join(cache, f'{name}.npz')
+        if not force and os.path.exists(path):
+            with np.load(path) as z:
+                if str(z['key']) == f'{key}/{options}':
+                    results[name] = {k: z[k] for k in z.files if k != 'key'}
+                    continue
+        todo.append((name, key, loader()))
+
+    series = []
+    for _, _, df in todo:
+        ns = df.index.as_unit('ns').asi8
+        with stage('resample'):
+            series += [resample(ns, df[s].to_numpy(dtype=float), dt) for s in sensors]
+
+    if todo:
+        with stage('welch'):
+            freq, psd, nseg = welch(series, dt, nperseg)
+        with stage('autocorr'):
+            acf = autocorr(series, int(round(maxlag / dt)))
+
+    for k, (name, key, df) in enumerate(todo):
+        rows = slice(k * len(sensors), (k + 1) * len(sensors))
+        res = {
+            'freq': freq, 'psd': psd[rows], 'nseg': nseg[rows], 'acf': acf[rows],
+            'mean': df[sensors].mean().to_numpy(), 'std': df[sensors].std().to_numpy()
+        }
+        np.savez(os.path.join(cache, f'{name}.npz'), key=f'{key}/{options}', **res)
+        results[name] = res
+
+    return results
+
+
+def spectral_table(results, dt=0.2, bands=((0.0, 0.2), (0.2, 1.0), (1.0, 2.5))):
+    """
+    Table of the fluctuation metrics for each name and sensor from the results
+    of `analyze`.
+
+    Columns
+    -------
+    mean, std       mean and standard deviation of the sensor
+    intensity       fluctuation intensity as std / |mean|
+    nseg            number of Welch segments
+    f_dom           dominant frequency excluding the zero frequency [Hz]
+    power           total power of the fluctuations from the spectrum
+    power_a_b       power in the frequency band from a to b Hz
+    t_int           integral time scale to the first zero crossing [s]
+    t_decorr        time for the autocorrelation to drop below 1/e [s]
+    """
+    import numpy as np
+    import pandas as pd
+
+    rows = []
+    for name, r in results.items():
+        freq, psd = r['freq'], r['psd']
+        df = freq[1] - freq[0]
+        t_int, t_decorr = timescales(r['acf'], dt)
+        for j, sensor in enumerate(sensors):
+            p = psd[j]
+            row = {
+                'item': name, 'sensor': sensor, 'mean': r['mean'][j], 'std': r['std'][j],
+                'intensity': r['std'][j] / abs(r['mean'][j]) if r['mean'][j] else np.nan,
+                'nseg': int(r['nseg'][j]),
+                'f_dom': freq[1:][np.argmax(p[1:])] if r['nseg'][j] else np.nan,
+                'power': p[1:].sum() * df
+            }
+            for lo, hi in bands:
+                row[f'power_{lo:g}_{hi:g}'] = p[(freq > lo) & (freq <= hi)].sum() * df
+            row['t_int'] = t_int[j]
+            row['t_decorr'] = t_decorr[j]
+            rows.append(row)
+
+    return pd.DataFrame(rows)
+
+
+def run(args):
+    """
+    Analyze the items or full-day files and write the table of metrics. The
+    arguments are the nperseg, maxlag, days, and force options of the spectral
+    subcommand in `riser.py`.
+    """
+    from functools import partial
+    from registry import load_experiments
+    from utils import read_processed
+
+    if args.days:
+        from process_hydro import read_historian
+        paths = {day: f'original-hydro/{day}_h00.csv' for day in args.days}
+        frames = {day: (partial(read_historian, path, 'h00'), stamp(path)) for day, path in paths.items()}
+        out = 'results-hydro/spectral_days.csv'
+    else:
+        exps = load_experiments()
+        frames = {
+            item: (partial(read_processed, item, 'h00', list(sensors)), stamp(f'processed-hydro/{item}_{f}_h00.csv'))
+            for item, f in zip(exps.index, exps['file'])
+            if os.path.exists(f'processed-hydro/{item}_{f}_h00.csv')
+        }
+        out = 'results-hydro/spectral.csv'
+
+    results = analyze(frames, nperseg=args.nperseg, maxlag=args.maxlag, force=args.force)
+    df = spectral_table(results)
+
+    print(df)
+    df.to_csv(out, index=False)
+
+
+def main():
+    import riser
+    riser.main(['spectral', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
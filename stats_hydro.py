@@ -0,0 +1,202 @@
+"""
+Statistics for every sensor in the R-cubed riser for all process gas groups and
+catalyst flows. The data for each item is loaded once and the statistics for
+all the sensors are computed together. This replaces running `dp_cat.py` and
+`temp_cat.py` for each gas group and sensor when only the stats are needed.
+
+Examples
+--------
+
+Stats for all sensors are written to `results-hydro/stats_all.csv`. Use the
+split option to also write a stats file for each PDIT and TE sensor and gas
+group like the `dp_cat.py` and `temp_cat.py` programs. Use the plot option to
+plot the stats for each PDIT and TE sensor.
+
+Extra metrics such as the median, percentiles, and rms fluctuation can be added
+to the stats as a comma separated list.
+
+>>> python stats_hydro.py
+>>> python stats_hydro.py --split
+>>> python stats_hydro.py --plot
+>>> python stats_hydro.py --extra median,p05,p95,rms
+
+Rows flagged by the quality checks of `quality.py` during processing are kept
+in the stats. Use the mask option to leave them out.
+
+>>> python stats_hydro.py --mask
+
+Use the compact option to load the data with categorical keys, int64
+timestamps, and float32 values, which takes about a third of the memory. See
+`compact.py` for the precision of the stats.
+
+>>> python stats_hydro.py --compact
+
+Use the steady option to compute the stats over the longest steady window of
+each item instead of the whole time window. The windows are written to
+`results-hydro/steady.csv`, see `steady.py` for the detection options.
+
+>>> python stats_hydro.py --steady
+>>> python stats_hydro.py --steady --window 120 --steady-sensors pdit700 te709c
+"""
+
+import sys
+from schema import cat_levels, gas_levels, historians, pdit_sensors, te_sensors
+from compact import long_frame, value_dtype
+from instrument import count, stage
+from steady import steady_windows, trim
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def experiments():
+    """
+    Table of the item number, process gas group, catalyst group, catalyst
+    flow, and replicate for each experiment in a gas and catalyst group. The
+    experiments are from the `experiments.csv` registry.
+    """
+    from registry import select
+
+    df = select(gas=gas_levels, cat=cat_levels)
+    return df[['gas', 'cat', 'catflow', 'replicate']].reset_index()
+
+
+def load_long(items, sensors=None, mask=False, compact=False):
+    """
+    Load the sensor data for the items into a long format dataframe with item,
+    sensor, DateTime, and value columns. Each processed file is read once. All
+    the sensors are loaded if `sensors` is not given. Rows flagged by the
+    quality checks are dropped if `mask` is True. With `compact` the item
+    and sensor columns are categorical, DateTime is int64 nanoseconds, and the
+    values are float32 where the precision allows, see `compact.py`.
+    """
+    import pandas as pd
+    from quality import apply_masks
+    from utils import read_processed
+
+    items = list(items)
+    dtype = value_dtype(sensors)
+    frames = []
+    for item in items:
+        for hist, (_, names, _) in historians.items():
+            cols = [n for n in names[1:] if sensors is None or n in sensors]
+            if not cols:
+                continue
+            df = read_processed(item, hist, cols, compact=compact)
+            with stage('melt'):
+                if compact:
+                    frames.append(long_frame(df, item, items, dtype))
+                    continue
+                df = df.melt(ignore_index=False, var_name='sensor', value_name='value').reset_index()
+            df['item'] = item
+            frames.append(df)
+    with stage('concat'):
+        df_long = pd.concat(frames, ignore_index=True)
+    if not mask:
+        return df_long
+    with stage('mask'):
+        df_masked = apply_masks(df_long)
+    count('masks', rows_masked=len(df_long) - len(df_masked))
+    # a range index in place of the int64 row labels left by the mask
+    return df_masked.reset_index(drop=True) if compact else df_masked
+
+
+def batch_stats(df_long, df_exp, extra=()):
+    """
+    Start, stop, mean, standard deviation, max, min, and any extra metrics for
+    every sensor and item in one groupby pass. Rows are ordered by sensor, gas
+    group, and catalyst group.
+    """
+    from utils import stats_table
+
+    with stage('stats_table'):
+        df = stats_table(df_long, by=['sensor', 'item'], extra=extra).reset_index()
+    return arrange(df, df_exp, extra)
+
+
+def arrange(df, df_exp, extra=()):
+    """
+    Add the experiment columns to the stats of each sensor and item, and
+    order the rows by sensor, gas group, and catalyst group. Categorical keys
+    of the compact data are given as strings so the rows are in the same
+    order as the stats of the float64 data.
+    """
+    df = df.astype({'sensor': str, 'item': str})
+    df = df.merge(df_exp, on='item')
+    df = df.sort_values(['sensor', 'gas', 'cat', 'replicate'], kind='stable')
+    cols = ['sensor', 'gas', 'cat', 'replicate', 'item', 'start', 'stop', 'catflow', 'mean', 'std', 'max', 'min']
+    return df[cols + list(extra)]
+
+
+def write_split(df_stats):
+    """
+    Write stats for each PDIT and TE sensor and gas group in the same format as
+    the `dp_cat.py` and `temp_cat.py` programs.
+    """
+    df = df_stats[df_stats['sensor'].isin(pdit_sensors + te_sensors) & (df_stats['cat'] != 'max')]
+    for (sensor, gas), d in df.groupby(['sensor', 'gas'], observed=True):
+        d = d.set_index('item')[['start', 'stop', 'catflow', 'mean', 'std', 'max', 'min']]
+        d.to_csv(f'results-hydro/{sensor.lower()}_{gas}.csv', index_label='item')
+
+
+def plot_stats(df_stats):
+    """
+    Plot the mean, max, and min for each PDIT and TE sensor versus catalyst
+    flow for the low, mid, and high process gas groups.
+    """
+    import matplotlib.pyplot as plt
+    from utils import config
+
+    for sensor in pdit_sensors + te_sensors:
+        ylabel = 'Differential pressure [kPa]' if sensor.startswith('PDIT') else 'Temperature [K]'
+        fig, axs = plt.subplots(1, 3, figsize=(9.4, 3.6), sharey=True, tight_layout=True)
+        for ax, gas in zip(axs, gas_levels):
+            d = df_stats[(df_stats['sensor'] == sensor) & (df_stats['gas'] == gas)]
+            ax.plot(d['catflow'], d['mean'], 'oC0', label='mean')
+            ax.plot(d['catflow'], d['max'], '.C1', label='max')
+            ax.plot(d['catflow'], d['min'], '.C2', label='min')
+            config(ax, 'Catalyst flow [kg/hr]', ylabel if gas == 'low' else '')
+            ax.set_title(f'{sensor} - {gas.capitalize()} process gas')
+
+    plt.show()
+
+
+def run(args):
+    """
+    Write the stats for all sensors and experiments. The arguments are the
+    split, plot, extra, steady, mask, and compact options of the stats
+    subcommand in `riser.py`. With the steady option the stats are computed
+    over the steady window of each item from `steady.py`.
+    """
+    df_exp = experiments()
+    df_long = load_long(df_exp['item'], mask=args.mask, compact=args.compact)
+
+    if args.steady:
+        with stage('steady'):
+            windows = steady_windows(
+                df_long, args.steady_sensors, args.window, args.drift_tol, args.std_tol, args.min_length
+            )
+        windows.to_csv('results-hydro/steady.csv', index_label='item')
+        print(f'Steady windows found for {windows["steady"].sum()} of {len(windows)} items.')
+        df_long = trim(df_long, windows)
+
+    df_stats = batch_stats(df_long, df_exp, args.extra)
+
+    print(df_stats)
+    with stage('to_csv'):
+        df_stats.to_csv('results-hydro/stats_all.csv', index=False)
+
+    if args.split:
+        write_split(df_stats)
+
+    if args.plot:
+        plot_stats(df_stats)
+
+
+def main():
+    import riser
+    riser.main(['stats', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Rolling statistics and steady state detection for the riser experiments. The
+rolling mean, standard deviation, and drift slope of each sensor are computed
+from cumulative sums so the cost is O(n) for any window size. A window is
+steady when its drift and standard deviation are within tolerances that are
+given relative to the noise level of the sensor in the item, which is the
+median of its rolling standard deviation. The longest time segment where every
+detection sensor is steady is selected for each item.
+
+The selected windows replace the hand-picked start and stop times when the
+stats are computed with the steady option of `stats_hydro.py`.
+
+Examples
+--------
+
+Steady windows for each item are written to `results-hydro/steady.csv`. The
+window option is the length of the rolling window in seconds. The drift and std
+tolerances are multiples of the noise level of each sensor.
+
+>>> python steady.py
+>>> python steady.py --window 120 --drift-tol 1.5 --steady-sensors pdit700 te709c
+>>> python stats_hydro.py --steady
+"""
+
+import sys
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def rolling_stats(t, y, w):
+    """
+    Rolling mean, standard deviation, and least squares slope of a series for
+    every window of `w` consecutive samples. Sums over each window are taken as
+    differences of cumulative sums so the cost does not depend on `w`.
+
+    Parameters
+    ----------
+    t : array
+        Time of each sample in seconds.
+    y : array
+        Values of the series without NaN values.
+    w : int
+        Number of samples in each window, at least 2.
+
+    Returns
+    -------
+    mean, std, slope : array
+        Stats for the n - w + 1 windows where window k starts at sample k. The
+        slope is the drift of the values per second.
+    """
+    import numpy as np
+
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # shift the values and time so the sums do not lose precision
+    y0 = y.mean()
+    y = y - y0
+    t = t - t[0]
+
+    def window_sum(a):
+        c = np.concatenate(([0.0], np.cumsum(a)))
+        return c[w:] - c[:-w]
+
+    sy = window_sum(y)
+    syy = window_sum(y * y)
+    st = window_sum(t)
+    stt = window_sum(t * t)
+    sty = window_sum(t * y)
+
+    mean = sy / w
+    std = np.sqrt(np.maximum(syy - sy * mean, 0) / (w - 1))
+    sxx = stt - st * st / w
+    slope = np.divide(sty - st * mean, sxx, out=np.zeros_like(sxx), where=sxx > 0)
+    return mean + y0, std, slope
+
+
+def runs(mask):
+    """
+    Start and stop indices of each run of True values in a boolean array. The
+    stop index is one past the end of the run.
+    """
+    import numpy as np
+
+    d = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+def steady_intervals(ns, y, window=60.0, drift_tol=2.0, std_tol=2.0):
+    """
+    Time intervals where a sensor is steady.
+
+    Parameters
+    ----------
+    ns : array
+        Timestamps of the samples as int64 nanoseconds.
+    y : array
+        Values of the sensor without NaN values.
+    window : float
+        Length of the rolling window in seconds.
+    drift_tol : float
+        Largest change of the fitted line over a window as a multiple of the
+        noise level.
+    std_tol : float
+        Largest standard deviation of a window as a multiple of the noise
+        level.
+
+    Returns
+    -------
+    intervals : list
+        Tuples of (start, stop) nanoseconds for each steady interval.
+    """
+    import numpy as np
+
+    ns = np.asarray(ns, dtype=np.int64)
+    if len(ns) < 3:
+        return []
+    dt = np.median(np.diff(ns)) / 1e9
+    w = min(max(int(round(window / dt)), 3), len(ns))
+
+    t = (ns - ns[0]) / 1e9
+    _, std, slope = rolling_stats(t, y, w)
+    noise = np.median(std)
+    if noise == 0:
+        return [(int(ns[0]), int(ns[-1]))]
+
+    duration = t[w - 1:] - t[:len(t) - w + 1]
+    steady = (np.abs(slope) * duration <= drift_tol * noise) & (std <= std_tol * noise)
+
+    # consecutive steady windows k0 to k1 - 1 cover samples k0 to k1 + w - 2
+    starts, stops = runs(steady)
+    return [(int(ns[k0]), int(ns[k1 + w - 2])) for k0, k1 in zip(starts, stops)]
+
+
+def intersect(a, b):
+    """
+    Intersection of two sorted lists of (start, stop) intervals.
+    """
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        lo = max(a[i][0], b[j][0])
+        hi = min(a[i][1], b[j][1])
+        if lo < hi:
+            out.append((lo, hi))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+def steady_windows(df_long, sensors, window=60.0, drift_tol=2.0, std_tol=2.0, min_length=120.0):
+    """
+    Longest steady window of each item where all the sensors are steady.
+
+    Parameters
+    ----------
+    df_long : dataframe
+        Long format data with item, sensor, DateTime, and value columns.
+    sensors : list
+        Sensors used to detect steady state such as PDIT700.
+    window, drift_tol, std_tol : float
+        Rolling window in seconds and tolerances for `steady_intervals`.
+    min_length : float
+        Shortest steady window in seconds. Items without a steady window of
+        this length keep their whole time window.
+
+    Returns
+    -------
+    df : dataframe
+        Start, stop, and length in seconds of the window for each item along
+        with the fraction of the item time window it covers and whether a
+        steady window was found.
+    """
+    import numpy as np
+    import pandas as pd
+
+    df_long = df_long[df_long['sensor'].isin(sensors)].dropna(subset=['value'])
+    rows = []
+
+    for item, d in df_long.groupby('item', sort=False):
+        ns = d['DateTime'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        t0, t1 = int(ns.min()), int(ns.max())
+        common = [(t0, t1)]
+        for sensor, g in d.groupby('sensor', sort=False):
+            gns = g['DateTime'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+            common = intersect(common, steady_intervals(gns, g['value'].to_numpy(), window, drift_tol, std_tol))
+
+        lo, hi = max(common, key=lambda iv: iv[1] - iv[0], default=(t0, t0))
+        found = (hi - lo) / 1e9 >= min_length
+        if not found:
+            lo, hi = t0, t1
+        rows.append((item, lo, hi, (hi - lo) / 1e9, (hi - lo) / max(t1 - t0, 1), found))
+
+    df = pd.DataFrame(rows, columns=['item', 'start', 'stop', 'length', 'fraction', 'steady'])
+    df['start'] = pd.to_datetime(df['start'])
+    df['stop'] = pd.to_datetime(df['stop'])
+    return df.set_index('item')
+
+
+def trim(df_long, windows):
+    """
+    Rows of the long format data inside the window of each item. Items that
+    are not in `windows` are kept whole. DateTime is datetime64 or int64
+    nanoseconds as in the compact data.
+    """
+    import numpy as np
+
+    items = df_long['item'].to_numpy(dtype=object)
+    start = windows['start'].reindex(items).to_numpy(dtype='datetime64[ns]')
+    stop = windows['stop'].reindex(items).to_numpy(dtype='datetime64[ns]')
+    t = df_long['DateTime'].to_numpy().astype('datetime64[ns]')
+    keep = np.isnat(start) | ((t >= start) & (t <= stop))
+    return df_long[keep]
+
+
+def run(args):
+    """
+    Detect and write the steady window of each item. The arguments are the
+    window, drift_tol, std_tol, min_length, and steady_sensors options of the
+    steady subcommand in `riser.py`.
+    """
+    from instrument import stage
+    from stats_hydro import experiments, load_long
+
+    df_exp = experiments()
+    df_long = load_long(df_exp['item'], args.steady_sensors)
+    with stage('steady'):
+        windows = steady_windows(
+            df_long, args.steady_sensors, args.window, args.drift_tol, args.std_tol, args.min_length
+        )
+
+    print(windows)
+    print(f'Steady windows found for {windows["steady"].sum()} of {len(windows)} items.')
+    windows.to_csv('results-hydro/steady.csv', index_label='item')
+
+
+def main():
+    import riser
+    riser.main(['steady', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Fast parser for the timestamps in the historian and processed data files.
+
+The format of a file is detected once from its first timestamp. All the rows
+are then decoded together as fixed width byte strings with numpy instead of
+parsing each string. Rows are grouped by the positions of their separators so
+timestamps where the hour or day is not zero padded are decoded with the same
+column slices as the rest of their group. ISO 8601 timestamps in the processed
+files are already parsed quickly by pandas so they are not decoded with numpy.
+
+Formats
+-------
+h00 historian       12/12/2018 0:28:41.77       %m/%d/%Y %H:%M:%S.%f
+h0m historian       12/10/2018 08:23:44         %m/%d/%Y %H:%M:%S
+h19 historian       12/10/18 0:00               %m/%d/%y %H:%M
+PIT000 sheet        12/10/18 0:00:51            %m/%d/%y %H:%M:%S
+processed files     2018-12-11 16:38:00.190     %Y-%m-%d %H:%M:%S.%f
+
+Example
+-------
+>>> from timestamps import parse_timestamps
+>>> ns = parse_timestamps(df['DateTime'].to_numpy())
+>>> index = pd.DatetimeIndex(ns.view('datetime64[ns]'))
+"""
+
+import re
+import numpy as np
+
+# Regular expression and the order of the date and time fields for each format.
+# The fields are month (m), day (d), four digit year (Y), two digit year (y),
+# hour (H), minute (M), second (S), and fraction of a second (f). The order is
+# None for formats that are parsed by pandas.
+formats = {
+    '%m/%d/%Y %H:%M:%S.%f': (r'\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2}\.\d{1,9}', 'mdYHMSf'),
+    '%m/%d/%Y %H:%M:%S': (r'\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{2}:\d{2}', 'mdYHMS'),
+    '%m/%d/%y %H:%M': (r'\d{1,2}/\d{1,2}/\d{2} \d{1,2}:\d{2}', 'mdyHM'),
+    '%m/%d/%y %H:%M:%S': (r'\d{1,2}/\d{1,2}/\d{2} \d{1,2}:\d{2}:\d{2}', 'mdyHMS'),
+    '%Y-%m-%d %H:%M:%S.%f': (r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{1,9}', None),
+    '%Y-%m-%d %H:%M:%S': (r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', None),
+}
+
+
+def detect_format(sample):
+    """
+    Detect the format of a timestamp string such as 12/10/2018 08:23:44. None
+    is returned if the format is not one of the known formats.
+    """
+    for fmt, (pattern, _) in formats.items():
+        if re.fullmatch(pattern, sample.strip()):
+            return fmt
+    return None
+
+
+def days_from_civil(y, m, d):
+    """
+    Number of days since 1970-01-01 for arrays of year, month, and day.
+    """
+    y = y - (m <= 2)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + np.where(m > 2, -3, 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def decode(values, order, width=32):
+    """
+    Decode an array of timestamp strings to nanoseconds since the epoch.
+
+    Parameters
+    ----------
+    values : array
+        Timestamp strings which all have the same format.
+    order : str
+        Order of the date and time fields such as mdYHMSf.
+    width : int
+        Width in bytes for each timestamp string.
+
+    Returns
+    -------
+    ns : array
+        Timestamps as int64 nanoseconds since 1970-01-01.
+
+    Raises
+    ------
+    ValueError
+        If a timestamp does not have the fields given by `order`.
+    """
+    raw = np.asarray(values, dtype=f'S{width}')
+    n = len(raw)
+    m = raw.view(np.uint8).reshape(n, width)
+    if n and m[:, -1].any():
+        raise ValueError(f'Timestamps are longer than {width - 1} characters.')
+
+    sep = (m < 48) | (m > 57)
+    layouts, inverse = np.unique(np.packbits(sep, axis=1).view(f'V{width // 8}').ravel(), return_inverse=True)
+
+    fields = {k: np.zeros(n, np.int64) for k in order}
+    ndigits = np.zeros(n, np.int64)
+
+    for i in range(len(layouts)):
+        rows = np.flatnonzero(inverse == i)
+        pos = np.flatnonzero(~sep[rows[0]])
+        breaks = np.flatnonzero(np.diff(pos) > 1)
+        starts = np.r_[pos[:1], pos[breaks + 1]]
+        stops = np.r_[pos[breaks] + 1, pos[-1:] + 1]
+        if len(starts) != len(order):
+            raise ValueError(f'Timestamp {values[rows[0]]} does not have the fields {order}.')
+        digits = m[rows].astype(np.int64) - 48
+        for k, a, b in zip(order, starts, stops):
+            fields[k][rows] = digits[:, a:b] @ 10 ** np.arange(b - a - 1, -1, -1)
+            if k == 'f':
+                ndigits[rows] = b - a
+
+    # two digit years are 1969-2068 like strptime
+    year = fields['Y'] if 'Y' in order else fields['y'] + np.where(fields['y'] < 69, 2000, 1900)
+    days = days_from_civil(year, fields['m'], fields['d'])
+    secs = ((days * 24 + fields['H']) * 60 + fields['M']) * 60
+    if 'S' in order:
+        secs += fields['S']
+    ns = secs * 1_000_000_000
+    if 'f' in order:
+        ns += fields['f'] * 10 ** (9 - ndigits)
+    return ns
+
+
+def parse_timestamps(values, fmt=None):
+    """
+    Parse timestamp strings from a data file to int64 nanoseconds since the
+    epoch. The format is detected from the first value if not given. ISO 8601
+    formats and timestamps that can not be decoded with numpy are parsed with
+    pandas.
+
+    Parameters
+    ----------
+    values : array
+        Timestamp strings from the DateTime column of a data file.
+    fmt : str, optional
+        Format of the timestamps such as %m/%d/%Y %H:%M:%S.
+
+    Returns
+    -------
+    ns : array
+        Timestamps as int64 nanoseconds since 1970-01-01.
+    """
+    values = np.asarray(values)
+    if fmt is None and len(values):
+        fmt = detect_format(str(values[0]))
+    if fmt in formats and formats[fmt][1] is not None:
+        try:
+            return decode(values, formats[fmt][1])
+        except (ValueError, UnicodeEncodeError):
+            pass
+    import pandas as pd
+    return pd.to_datetime(values, format=fmt).as_unit('ns').asi8
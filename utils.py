@@ -2,47 +2,357 @@
 Helper functions for analyzing the experimental data.
 """
 
+import functools
+import os
+import numpy as np
 import pandas as pd
+from compact import value_dtype
+from instrument import count, stage
+from quality import load_masks, masked
+from schema import cadence, historians, sensors
+from sensor_store import load_index, read_slice
+from timestamps import parse_timestamps
 
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
 
-def df_experiment(colname, items, files):
+
+def historian(colname):
+    """
+    Historian name as h00, h0m, or h19 for a column name such as PDIT700.
+    """
+    if colname not in sensors:
+        raise ValueError(f'No column {colname} in the historian data.')
+    return sensors[colname]
+
+
+# processed file name for each item and historian along with the modification
+# time of the directory when it was listed
+_files = {}
+
+
+def item_files(src='processed-hydro'):
+    """
+    Index of the processed CSV file for each item and historian such as
+    ('001', 'h0m'): '001_rd181211_h0m.csv'. The directory is listed once and
+    listed again only when its modification time changes.
     """
-    Create a dataframe for a group of three experiments.
+    mtime = os.stat(src).st_mtime_ns
+    cached = _files.get(src)
+    if cached is None or cached[0] != mtime:
+        index = {}
+        for f in os.listdir(src):
+            parts = f[:-4].split('_')
+            if f.endswith('.csv') and len(parts) == 3:
+                index[parts[0], parts[2]] = f
+        cached = _files[src] = (mtime, index)
+    return cached[1]
+
+
+def processed_path(item, hist, src='processed-hydro'):
+    """
+    Path of the processed CSV file for an item and historian.
+    """
+    f = item_files(src).get((item, hist))
+    if f is None:
+        raise FileNotFoundError(f'No processed {hist} file for item {item} in {src}.')
+    return os.path.join(src, f)
+
+
+def in_store(item, hist, store='cache-hydro'):
+    """
+    True if the item is in the memory-mapped store or the columnar store.
+    """
+    index = load_index()
+    if index is not None and f'{item}/{hist}' in index['items']:
+        return True
+    return pq is not None and os.path.exists(os.path.join(store, hist, f'{item}.parquet'))
+
+
+def add_baseline(df, item, hist):
+    """
+    Add the baseline that was subtracted during processing back to the sensor
+    columns of an item to give the raw values. Sensors without a baseline are
+    not changed.
+    """
+    from process_hydro import load_baselines
+    from registry import load_experiments
+
+    baseline = load_baselines().get(f"{load_experiments().loc[item, 'file']}_{hist}", {})
+    for c in df.columns:
+        if c in baseline:
+            df[c] = df[c] + baseline[c]['baseline']
+    return df
+
+
+def read_processed(item, hist, colnames, store='cache-hydro', raw=False, compact=False):
+    """
+    Read columns for an item from the memory-mapped store or the columnar
+    store. Fall back to the CSV file in the `processed-hydro` directory if the
+    item is not in either store. Values are baseline corrected unless the raw
+    values are requested. A float32 memory-mapped store is only read for
+    compact data of sensors that are float32 in `compact.py`.
 
     Parameters
     ----------
-    colname : str
-        Column name from experimental data given as pdit700 or te770 etc.
-    items : tuple
-        Item numbers for three experiments.
-    files : list
-        Data files from riser experiments.
-
-    Note
-    ----
-    `item_files` are names of CSV data files which are named according to item
-    number in the experiment matrix spreadsheet.
-    """
-    item_files = sorted([f for f in files if f.startswith(items)])
-    df_items = [pd.read_csv(f'processed-hydro/{f}', usecols=['DateTime', colname]) for f in item_files]
-    df = pd.concat(df_items, axis=1)
-    df.columns = [f'DateTime{items[0]}', items[0], f'DateTime{items[1]}', items[1], f'DateTime{items[2]}', items[2]]
+    item : str
+        Item number such as 001 or 101.
+    hist : str
+        Historian name given as h00, h0m, or h19.
+    colnames : list
+        Column names such as PDIT700 or TE709C.
+    store : str
+        Directory of the columnar store.
+    raw : bool
+        Add the baseline back to give the raw sensor values.
+    compact : bool
+        Accept float32 values from the memory-mapped store.
+
+    Returns
+    -------
+    df : dataframe
+        Columns for the item indexed by datetime.
+    """
+    dtypes = ('float64', value_dtype(colnames).name) if compact else ('float64',)
+    with stage('read_store'):
+        time, values = read_slice(item, hist, colnames, dtypes=dtypes)
+    path = os.path.join(store, hist, f'{item}.parquet')
+
+    if time is not None:
+        df = pd.DataFrame(values, index=pd.DatetimeIndex(time, name='DateTime'))
+    elif pq is not None and os.path.exists(path):
+        # only the requested columns are read and the arrow buffers are used
+        # directly as the numpy arrays of the dataframe
+        with stage('read_parquet'):
+            table = pq.ParquetFile(path).read(columns=['DateTime'] + list(colnames))
+            index = pd.Index(table.column('DateTime').to_numpy(), name='DateTime')
+            df = pd.DataFrame({c: table.column(c).to_numpy() for c in colnames}, index=index)
+    else:
+        f = processed_path(item, hist)
+        with stage('read_processed_csv'):
+            df = pd.read_csv(f, usecols=['DateTime'] + list(colnames), index_col='DateTime')
+            df.index = pd.DatetimeIndex(parse_timestamps(df.index.to_numpy()).view('datetime64[ns]'), name='DateTime')
+
+    count(f'{item}_{hist}', rows_loaded=len(df))
+    return add_baseline(df, item, hist) if raw else df
+
+
+def align_item(item, sensors=None, clock='h0m', how='nearest', tolerance=None):
+    """
+    Join the h00, h0m, and h19 data for an item onto one clock.
+
+    Parameters
+    ----------
+    item : str
+        Item number such as 001 or 101.
+    sensors : list, optional
+        Column names such as PDIT705, PDIT700, and TE709C. All the columns of
+        the three historians are used if not given.
+    clock : str
+        Historian name given as h00, h0m, or h19 to use the timestamps of that
+        historian, otherwise a frequency such as 1s or 10s for a regular clock.
+        With mean or last a historian name is the frequency of its cadence
+        in `schema.py`.
+    how : str
+        Given as nearest or asof to join the sample nearest in time or the
+        last sample at or before each clock time. Given as mean or last to
+        resample each historian to the frequency of the clock.
+    tolerance : str, optional
+        Max time between a clock time and a joined sample such as 5s. Default
+        is the nominal sample interval of each joined historian.
+
+    Returns
+    -------
+    df : dataframe
+        Columns for the sensors indexed by the clock times.
+    """
+    if sensors is None:
+        cols = {hist: names[1:] for hist, (_, names, _) in historians.items()}
+    else:
+        cols = {}
+        for s in sensors:
+            cols.setdefault(historian(s.upper()), []).append(s.upper())
+
+    if clock in historians:
+        freq = pd.Timedelta(seconds=cadence[clock])
+    else:
+        try:
+            freq = pd.tseries.frequencies.to_offset(clock)
+        except ValueError:
+            raise ValueError(f'Unknown clock {clock}, use {", ".join(historians)}, or a frequency such as 1s or 10s.') from None
+
+    frames = {hist: read_processed(item, hist, c) for hist, c in cols.items()}
+
+    if how in ('mean', 'last'):
+        return pd.concat([df.resample(freq).agg(how) for df in frames.values()], axis=1)
+
+    if how not in ('nearest', 'asof'):
+        raise ValueError(f'Unknown join {how}, use nearest, asof, mean, or last.')
+
+    if clock in historians:
+        index = frames[clock].index if clock in frames else read_processed(item, clock, []).index
+    else:
+        t0 = max(df.index[0] for df in frames.values())
+        t1 = min(df.index[-1] for df in frames.values())
+        index = pd.date_range(t0.ceil(freq), t1, freq=freq, name='DateTime')
+
+    df = pd.DataFrame(index=index)
+    direction = 'nearest' if how == 'nearest' else 'backward'
+    for hist, df_hist in frames.items():
+        tol = pd.Timedelta(tolerance) if tolerance else pd.Timedelta(seconds=cadence[hist])
+        df = pd.merge_asof(df, df_hist, left_index=True, right_index=True, direction=direction, tolerance=tol)
     return df
 
 
-def stats(catflow, df, item):
+@functools.lru_cache(maxsize=128)
+def item_arrays(item, hist, version, compact=False):
+    """
+    Timestamps and values of all the sensors of an item and historian. The
+    arrays are read-only because they are kept in an LRU cache for the other
+    calls in the same process, such as when sensors are swept over the same
+    items. The version is the size and modification time of the processed
+    file so an updated file is read again. The values are read for compact
+    data if `compact` is True, see `read_processed`.
+    """
+    names = historians[hist][1][1:]
+    df = read_processed(item, hist, names, compact=compact)
+    time = df.index.to_numpy()
+    values = {c: df[c].to_numpy(dtype=float) for c in names}
+    for a in (time, *values.values()):
+        a.flags.writeable = False
+    return time, values
+
+
+def load_items(colname, items, arrays=False, mask=False, compact=False):
+    """
+    Load a column for any number of items such as the repeated experiments
+    of a catalyst group. Files are found from the index of `item_files` and
+    the data for each item is cached by `item_arrays`. Rows where the value is
+    missing are dropped for each item so items of different lengths are not
+    padded, along with rows flagged by the quality checks of `quality.py`
+    if `mask` is True.
+
+    Parameters
+    ----------
+    colname : str
+        Column name such as PDIT700 or TE709C.
+    items : list
+        Item numbers such as 001 or 101.
+    arrays : bool
+        Return a dict of arrays instead of a dataframe.
+    mask : bool
+        Drop the rows flagged by the quality checks.
+    compact : bool
+        Give the timestamps as int64 nanoseconds, the values as float32 where
+        the precision allows, and the item column as categorical, see
+        `compact.py`.
+
+    Returns
+    -------
+    df : dataframe
+        Long format data with item, DateTime, and value columns.
+    data : dict
+        Tuple of (timestamps, values) arrays for each item if `arrays` is
+        True.
+    """
+    hist = historian(colname)
+    masks = load_masks() if mask else {}
+    dtype = value_dtype([colname]) if compact else np.dtype(np.float64)
+    data = {}
+    for item in items:
+        st = os.stat(processed_path(item, hist))
+        time, values = item_arrays(item, hist, (st.st_size, st.st_mtime_ns), compact)
+        y = values[colname]
+        ok = ~np.isnan(y) & ~masked(masks, item, colname, time)
+        data[item] = (time[ok].view(np.int64), y[ok].astype(dtype)) if compact else (time[ok], y[ok])
+
+    return data if arrays else items_frame(data, compact)
+
+
+def items_frame(data, compact=False):
     """
-    Determine mean, standard deviation, max, and min for column in the
-    dataframe.
+    Long format data with item, DateTime, and value columns from the dict of
+    (timestamps, values) arrays for each item given by `load_items`, so a
+    column is loaded once for both its arrays and its long format data. The
+    item column is categorical if `compact` is True.
+    """
+    lengths = [len(t) for t, _ in data.values()]
+    if compact:
+        keys = pd.Categorical.from_codes(np.repeat(np.arange(len(data)), lengths), categories=list(data))
+    else:
+        keys = np.repeat(np.array(list(data), dtype=object), lengths)
+
+    with stage('concat'):
+        return pd.DataFrame({
+            'item': keys,
+            'DateTime': np.concatenate([t for t, _ in data.values()] or [np.empty(0, np.int64 if compact else 'datetime64[ns]')]),
+            'value': np.concatenate([y for _, y in data.values()] or [np.empty(0, np.float32 if compact else np.float64)])
+        })
+
+
+def stats_table(df, by='item', extra=()):
+    """
+    Determine start, stop, mean, standard deviation, max, and min for each group
+    of the long format data in a single aggregation, along with the median and
+    rms. The percentiles are computed by one quantile call for all of them on
+    the same grouping, since a quantile inside the aggregation calls a Python
+    function for each group and takes about 10 times as long.
+
+    Parameters
+    ----------
+    df : dataframe
+        Long format data with DateTime and value columns along with the group
+        columns such as item and sensor. DateTime is datetime64 or int64
+        nanoseconds and the values are float64 or float32.
+    by : str or list
+        Column names to group by.
+    extra : tuple
+        Extra metrics given as median, rms, or percentiles such as p05 and p95.
+        The rms is the root mean square fluctuation about the mean.
+
+    Returns
+    -------
+    df_stats : dataframe
+        Stats for each group where the group columns are the index.
     """
-    start = df['DateTime' + item].iloc[0]
-    stop_idx = df['DateTime' + item].last_valid_index()
-    stop = df['DateTime' + item].iloc[stop_idx]
-    dp_mean = df[item].mean()
-    dp_std = df[item].std()
-    dp_max = df[item].max()
-    dp_min = df[item].min()
-    return [start, stop, catflow, dp_mean, dp_std, dp_max, dp_min]
+    pcts = [e for e in extra if e[0] == 'p' and e[1:].isdigit()]
+    unknown = set(extra) - set(pcts) - {'median', 'rms'}
+    if unknown:
+        raise ValueError(f'Unknown stats metric {", ".join(sorted(unknown))}.')
+
+    # float32 values of the compact data are accumulated in float64
+    df = df.dropna(subset=['value'])
+    if df['value'].dtype != np.float64:
+        df = df.assign(value=df['value'].astype(np.float64))
+    grouped = df.groupby(by, sort=False, observed=True)
+
+    aggs = {
+        'start': ('DateTime', 'first'), 'stop': ('DateTime', 'last'),
+        'mean': ('value', 'mean'), 'std': ('value', 'std'),
+        'max': ('value', 'max'), 'min': ('value', 'min'), 'count': ('value', 'count')
+    }
+    if 'median' in extra:
+        aggs['median'] = ('value', 'median')
+    df_stats = grouped.agg(**aggs)
+
+    # int64 nanoseconds of the compact data are returned as datetimes
+    for c in ('start', 'stop'):
+        if df_stats[c].dtype == np.int64:
+            df_stats[c] = df_stats[c].to_numpy().view('datetime64[ns]')
+
+    # the groups are not found again for the quantiles
+    if pcts:
+        q = grouped['value'].quantile([int(p[1:]) / 100 for p in pcts]).unstack()
+        q.columns = pcts
+        df_stats = df_stats.join(q)
+
+    if 'rms' in extra:
+        n = df_stats['count']
+        df_stats['rms'] = df_stats['std'] * ((n - 1) / n) ** 0.5
+
+    return df_stats.drop(columns='count')
 
 
 def config(ax, xlabel, ylabel):
@@ -0,0 +1,506 @@
+"""
+Watch the `original-hydro` directory for new or growing historian files during
+a campaign and keep the processed files, quality masks, and stats up to date
+without processing everything again.
+
+The directory is polled for `rdYYMMDD_h00.csv`, `rdYYMMDD_h0m.csv`, and
+`rdYYMMDD_h19.csv` files of the days in the `experiments.csv` registry. The
+byte offset of the last complete line parsed from each file is saved, and
+only the bytes after it are parsed on the next poll. A line that is still
+being written is left for the next poll. The new rows in each item window are
+appended to the processed file of the item and run through the quality checks
+of `quality.py`, which carry the last rows of each item over to the next poll.
+
+The count, mean, sum of squared differences from the mean, min, max, start,
+and stop of each sensor and item are kept as accumulators. The accumulator of
+the new rows is merged into the saved one with the parallel update of Chan et
+al., so the stats of an item do not depend on how its rows were split across
+polls. With the mask option the rows in the intervals flagged by the quality
+checks are left out, and the last rows of an item whose flags wait for the
+rows after them are merged in as checked at the end of the item until the
+next poll. The stats of every item are written to `results-hydro/stats_all.csv` in the same format as
+`stats_hydro.py` after each poll with new rows.
+
+Items whose original file is not in `original-hydro` get their stats from
+the processed file once. The state of the watcher is saved to
+`cache-hydro/watch.pkl` after each poll. Processed files that were appended to
+after the last save are cut back to their saved size when the watcher starts
+again. A file that shrinks, has a new header, or has new item windows in the
+registry is parsed again from the start.
+
+Processed items are removed from the manifest of `process_hydro.py`, so the
+next ingest writes them again from the whole file. The
+columnar and memory-mapped stores of the items are removed until they are
+built again.
+
+Examples
+--------
+
+Poll every 5 seconds until stopped with Ctrl+C. Use the once option to poll
+one time, the reset option to parse all the files from the start, and the
+split option to also write the stats file for each sensor and gas group. The
+saved state is discarded when the mask option is not the same as in the last
+run.
+
+>>> python watch.py
+>>> python watch.py --interval 30 --split --mask
+>>> python watch.py --once --reset
+"""
+
+import io
+import os
+import re
+import sys
+import time
+from instrument import count, stage
+from process_hydro import (
+    apply_baseline, atomic, group_windows, load_baselines, load_manifest, parse_datetime, read_header,
+    save_baselines, save_manifest, usecols
+)
+from schema import historians
+from sensor_store import remove_index
+
+state_path = os.path.join('cache-hydro', 'watch.pkl')
+stats_path = os.path.join('results-hydro', 'stats_all.csv')
+
+# day files of the historians
+pattern = re.compile(r'(rd\d{6})_(h00|h0m|h19)\.csv$')
+
+# Functions
+# ----------------------------------------------------------------------------
+
+
+def new_state(mask=False):
+    """
+    State of the watcher with an entry for each original file, and the stats
+    accumulators and quality checks for each item and historian. Rows flagged
+    by the checks are left out of the stats if `mask` is True.
+    """
+    return {'files': {}, 'stats': {}, 'scans': {}, 'mask': mask}
+
+
+def load_state(path=state_path):
+    """
+    Load the saved state, or a new state if the file does not exist or can
+    not be read.
+    """
+    import pickle
+
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return new_state()
+
+
+def save_state(state, path=state_path):
+    """
+    Save the state of the watcher.
+    """
+    import pickle
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic(path) as tmp, open(tmp, 'wb') as f:
+        pickle.dump(state, f)
+
+
+def recover(state, dst='processed-hydro'):
+    """
+    Cut the processed files back to their size in the saved state, in case
+    rows were appended after the state was saved. Original files are parsed
+    again from the start if one of their processed files is shorter than in
+    the state or was replaced, such as by `process_hydro.py`.
+    """
+    for f, entry in list(state['files'].items()):
+        for item, (size, ino) in entry['sizes'].items():
+            path = os.path.join(dst, f'{item}_{f}')
+            st = os.stat(path) if os.path.exists(path) else None
+            if st is None or st.st_ino != ino or st.st_size < size:
+                reset(state, f)
+                break
+            if st.st_size > size:
+                os.truncate(path, size)
+
+
+def reset(state, f, windows=()):
+    """
+    Forget a file and the stats and checks of its items, and of the items in
+    its new windows, so it is parsed again from the start.
+    """
+    entry = state['files'].pop(f, None)
+    hist = f[-7:-4]
+    for item, _, _ in list(windows) + (entry['windows'] if entry else []):
+        state['stats'].pop((f'{item:03g}', hist), None)
+        state['scans'].pop((f'{item:03g}', hist), None)
+
+
+def summarize(ns, values):
+    """
+    Accumulators of the count, mean, sum of squared differences from the
+    mean, min, max, and first and last timestamps of each column of values.
+    NaN values are left out.
+
+    Parameters
+    ----------
+    ns : array
+        Timestamps as int64 nanoseconds.
+    values : array
+        Values of shape (rows, sensors).
+    """
+    import numpy as np
+
+    ok = ~np.isnan(values)
+    n = ok.sum(axis=0)
+    first = ok.argmax(axis=0) if len(values) else n
+    last = len(values) - 1 - ok[::-1].argmax(axis=0) if len(values) else n
+    ns = ns if len(ns) else np.zeros(1, np.int64)
+
+    # shift by the first value so the sums do not lose precision and the
+    # mean of a constant sensor is exact
+    y0 = np.where(n > 0, values[first, np.arange(values.shape[1])], 0.0) if len(values) else np.zeros(len(n))
+    y = np.where(ok, values - y0, 0.0)
+    mean = y.sum(axis=0) / np.maximum(n, 1)
+    return {
+        'n': n, 'mean': mean + y0, 'm2': (np.where(ok, y - mean, 0.0) ** 2).sum(axis=0),
+        'min': np.where(ok, values, np.inf).min(axis=0), 'max': np.where(ok, values, -np.inf).max(axis=0),
+        'start': ns[first], 'stop': ns[last]
+    }
+
+
+def merge(a, b):
+    """
+    Accumulators of the rows of `a` followed by the rows of `b`.
+    """
+    import numpy as np
+
+    n = a['n'] + b['n']
+    delta = b['mean'] - a['mean']
+    return {
+        'n': n,
+        'mean': a['mean'] + delta * b['n'] / np.maximum(n, 1),
+        'm2': a['m2'] + b['m2'] + delta ** 2 * a['n'] * b['n'] / np.maximum(n, 1),
+        'min': np.minimum(a['min'], b['min']), 'max': np.maximum(a['max'], b['max']),
+        'start': np.where(a['n'] > 0, a['start'], b['start']), 'stop': np.where(b['n'] > 0, b['stop'], a['stop'])
+    }
+
+
+def masked_summary(scan, ns, values):
+    """
+    Accumulators of rows of an item with the rows in the intervals flagged by
+    its quality checks left out.
+    """
+    # rows are masked by time like `apply_masks` so repeated timestamps of a
+    # flagged row are left out too
+    import numpy as np
+    import quality
+
+    masks = quality.scan_masks(scan)
+    values = values.copy()
+    for j, name in enumerate(scan['names']):
+        values[quality.masked(masks, scan['item'], name, ns), j] = np.nan
+    return summarize(ns, values)
+
+
+def add_rows(state, item, hist, df):
+    """
+    Run the quality checks on new rows of an item and merge the rows into
+    the stats of the item. With the mask option of the state only the rows
+    whose flags are known are merged, without the flagged rows.
+    """
+    import numpy as np
+    import quality
+
+    key = (item, hist)
+    scan = state['scans'].setdefault(key, quality.new_scan(item, hist))
+    with stage('quality'):
+        ns, values = quality.update(scan, df)
+
+    if state['mask']:
+        if not len(ns):
+            return
+        acc = masked_summary(scan, ns, values)
+    else:
+        acc = summarize(df.index.to_numpy(dtype='datetime64[ns]').view(np.int64), df[scan['names']].to_numpy(dtype=float))
+    state['stats'][key] = merge(state['stats'][key], acc) if key in state['stats'] else acc
+
+
+def current_stats(state):
+    """
+    Accumulators of each item and historian. With the mask option the rows
+    whose flags wait for the rows after them are merged in as checked at the
+    end of the item, without changing the state.
+    """
+    import quality
+
+    if not state['mask']:
+        return state['stats']
+    stats = dict(state['stats'])
+    for key, scan in state['scans'].items():
+        ns, values = quality.pending(scan)
+        if len(ns):
+            acc = masked_summary(quality.close(scan), ns, values)
+            stats[key] = merge(stats[key], acc) if key in stats else acc
+    return stats
+
+
+def write_rows(df, item, f, entry, dst, hist):
+    """
+    Write the first rows of an item to a new processed file and append the
+    rows after them. The columnar store of the item is removed since it is
+    out of date.
+    """
+    path = os.path.join(dst, f'{item}_{f}')
+    with stage('to_csv'):
+        if item in entry['sizes']:
+            with open(path, 'a', newline='') as fh:
+                df.to_csv(fh, header=False)
+        else:
+            with atomic(path) as tmp:
+                df.to_csv(tmp)
+            parquet = os.path.join('cache-hydro', hist, f'{item}.parquet')
+            if os.path.exists(parquet):
+                os.remove(parquet)
+    st = os.stat(path)
+    entry['sizes'][item] = (st.st_size, st.st_ino)
+
+
+def update_file(state, f, windows, src='original-hydro', dst='processed-hydro'):
+    """
+    Parse the lines added to an original file since the last poll and add
+    the rows in each item window to the processed files and stats.
+
+    Parameters
+    ----------
+    state : dict
+        State of the watcher, updated in place.
+    f : str
+        File name such as rd181210_h0m.csv.
+    windows : list
+        Tuples of (item number, start time, stop time) for the day.
+
+    Returns
+    -------
+    nrows : int
+        Number of new rows, None if the file has not changed.
+    items : set
+        Tuples of (item, historian) with new rows.
+    """
+    import pandas as pd
+
+    hist = f[-7:-4]
+    path = os.path.join(src, f)
+    st = os.stat(path)
+    entry = state['files'].get(f)
+    if entry and entry['windows'] == windows and (st.st_size, st.st_mtime_ns) == (entry['offset'], entry['mtime']):
+        return None, set()
+
+    with open(path, 'rb') as fh:
+        head = fh.readline() + fh.readline()
+    if head.count(b'\n') < 2:
+        return None, set()
+
+    if entry is None or entry['windows'] != windows or entry['head'] != head or st.st_size < entry['offset']:
+        reset(state, f, windows)
+        try:
+            base, _ = read_header(path, hist)
+        except ValueError as e:
+            print(f'Skip {f}, {e}')
+            return None, set()
+        entry = state['files'][f] = {
+            'offset': len(head), 'mtime': 0, 'head': head, 'base': base, 'baseline': None,
+            'windows': windows, 'sizes': {}
+        }
+
+    with open(path, 'rb') as fh:
+        fh.seek(entry['offset'])
+        data = fh.read()
+    data = data[:data.rfind(b'\n') + 1]
+    entry['mtime'] = st.st_mtime_ns if entry['offset'] + len(data) == st.st_size else 0
+    if not data:
+        return None, set()
+
+    with stage('read_csv'):
+        chunk = pd.read_csv(io.BytesIO(data), header=None, usecols=usecols(hist), encoding='utf-8-sig')
+    entry['offset'] += len(data)
+    count(f[:-4], bytes_read=len(data), rows_parsed=len(chunk))
+    nrows = len(chunk)
+    chunk = chunk.dropna()
+    if chunk.empty:
+        return nrows, set()
+
+    with stage('baseline'):
+        chunk, entry['baseline'] = apply_baseline(chunk, hist, entry['base'], entry['baseline'])
+    with stage('to_datetime'):
+        chunk['DateTime'] = parse_datetime(chunk['DateTime'].to_numpy(), historians[hist][2])
+        chunk = chunk.set_index(['DateTime'])
+
+    tod = chunk.index - chunk.index.normalize()
+    items = set()
+    for item, t0, t1 in windows:
+        mask = (tod >= pd.Timedelta(f'{t0}:00')) & (tod <= pd.Timedelta(f'{t1}:00'))
+        if not mask.any():
+            continue
+        df_item = chunk[mask]
+        key = f'{item:03g}'
+        add_rows(state, key, hist, df_item)
+        write_rows(df_item, key, f, entry, dst, hist)
+        items.add((key, hist))
+
+    return nrows, items
+
+
+def seed_missing(state, df_exp, src='original-hydro'):
+    """
+    Stats of the items whose original files are not in `src` from their
+    processed files, with the rows masked by earlier quality checks left out
+    if the state has the mask option. Each item is read once.
+
+    Returns
+    -------
+    items : set
+        Tuples of (item, historian) that were read.
+    """
+    import numpy as np
+    import quality
+    from utils import item_files, read_processed
+
+    files = item_files()
+    masks = quality.load_masks() if state['mask'] else {}
+    items = set()
+    for item in df_exp['item']:
+        for hist, (_, names, _) in historians.items():
+            key = (item, hist)
+            fname = files.get(key)
+            if key in state['stats'] or fname is None or os.path.exists(os.path.join(src, fname[len(item) + 1:])):
+                continue
+            df = read_processed(item, hist, names[1:])
+            values = df.to_numpy(dtype=float, copy=True)
+            for j, name in enumerate(names[1:]):
+                values[quality.masked(masks, item, name, df.index), j] = np.nan
+            state['stats'][key] = summarize(df.index.to_numpy(dtype='datetime64[ns]').view(np.int64), values)
+            items.add(key)
+    return items
+
+
+def stats_frame(stats, df_exp):
+    """
+    Stats of each sensor and item from the accumulators in the same format as
+    `batch_stats` in `stats_hydro.py`.
+    """
+    import numpy as np
+    import pandas as pd
+    from stats_hydro import arrange
+
+    frames = []
+    for (item, hist), acc in stats.items():
+        n = acc['n']
+        ok = n > 0
+        std = np.sqrt(acc['m2'] / np.where(n > 1, n - 1, np.nan))
+        frames.append(pd.DataFrame({
+            'sensor': np.array(historians[hist][1][1:])[ok], 'item': item,
+            'start': pd.to_datetime(acc['start'][ok]), 'stop': pd.to_datetime(acc['stop'][ok]),
+            'mean': acc['mean'][ok], 'std': std[ok], 'max': acc['max'][ok], 'min': acc['min'][ok]
+        }))
+    return arrange(pd.concat(frames, ignore_index=True), df_exp)
+
+
+def write_results(state, items, split=False):
+    """
+    Write the stats, quality masks, and report after a poll, and remove the
+    items with new rows from the manifest and the memory-mapped store.
+    """
+    import quality
+    from stats_hydro import experiments, write_split
+
+    df_stats = stats_frame(current_stats(state), experiments())
+    with stage('to_csv'), atomic(stats_path) as tmp:
+        df_stats.to_csv(tmp, index=False)
+    if split:
+        write_split(df_stats)
+
+    scanned = [k for k in items if k in state['scans']]
+    if scanned:
+        checks = [quality.finish(state['scans'][k]) for k in scanned]
+        quality.save([m for m, _ in checks], [r for _, r in checks], set(scanned))
+
+    baselines = load_baselines()
+    manifest = load_manifest()
+    written = False
+    for f, entry in state['files'].items():
+        if entry['baseline']:
+            baselines[f[:-4]] = entry['baseline']
+        for item in entry['sizes']:
+            if (item, f[-7:-4]) in items:
+                manifest['outputs'].pop(f'{item}_{f}', None)
+                written = True
+    save_baselines(baselines)
+    save_manifest(manifest)
+    if written:
+        remove_index()
+    return df_stats
+
+
+def poll(state, src='original-hydro', split=False):
+    """
+    Parse the new lines of every original file once and write the results
+    if any item has new rows.
+
+    Returns
+    -------
+    items : set
+        Tuples of (item, historian) with new rows.
+    """
+    from registry import conditions
+    from stats_hydro import experiments
+
+    windows = group_windows(conditions())
+    items = set()
+    for f in sorted(os.listdir(src)):
+        m = pattern.match(f)
+        if m is None or m[1] not in windows:
+            continue
+        tic = time.perf_counter()
+        nrows, new = update_file(state, f, windows[m[1]], src)
+        if nrows is not None:
+            names = ' '.join(sorted(item for item, _ in new)) or 'none'
+            print(f'Update {f} ... {nrows} new rows, items {names} in {time.perf_counter() - tic:.2f} s')
+        items |= new
+
+    items |= seed_missing(state, experiments(), src)
+    if items:
+        df_stats = write_results(state, items, split)
+        print(f'Write {stats_path} ... {len(df_stats)} rows for {len(items)} updated item files. Complete.')
+    return items
+
+
+def run(args):
+    """
+    Poll the original files until stopped. The arguments are the interval,
+    once, reset, split, and mask options of the watch subcommand in
+    `riser.py`.
+    """
+    state = new_state(args.mask) if args.reset else load_state()
+    if state.get('mask') != args.mask:
+        print('Mask option changed, parse all files from the start.')
+        state = new_state(args.mask)
+    recover(state)
+    print(f'Watch original-hydro every {args.interval:g} s, stop with Ctrl+C.')
+
+    try:
+        while True:
+            if poll(state, split=args.split):
+                save_state(state)
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print('Stop watching.')
+
+
+def main():
+    import riser
+    riser.main(['watch', *sys.argv[1:]])
+
+
+if __name__ == '__main__':
+    main()